@@ -1,13 +1,15 @@
 import logging
 import time
+import shutil
 from pathlib import Path
 from dotenv import load_dotenv
 import os
 import argparse
 
+from config import VECTOR_BACKEND, SNAPSHOTS_TO_KEEP, EMBED_BATCH_SIZE, NEAR_DUP_MODE, NEAR_DUP_THRESHOLD, SCAN_WORKERS
+
 from src.utils.io_utils import (
 	ensure_data_dir,
-	create_metadata_file,
 	read_file,
 	json_to_dict,
 	save_dict_to_json,
@@ -16,11 +18,33 @@ from src.utils.io_utils import (
 )
 
 from src.utils.scan_utils import (
-	retrieve_md_filenames
+	scan_knowledge_files
+)
+
+from src.utils.snapshot_utils import (
+	build_lock,
+	current_snapshot_dir,
+	create_staging_dir,
+	publish_snapshot,
+	discard_staging_dir,
+	gc_snapshots,
+	import_legacy_data,
+	read_manifest,
+	write_manifest
+)
+
+from src.utils.signal_utils import (
+	graceful_shutdown
+)
+
+from src.utils.collection_utils import (
+	DEFAULT_COLLECTION,
+	configured_collection
 )
 
 from src.utils.hash_utils import (
 	hash_file,
+	partition_of,
 	needs_processing,
 	compare_old_new_metadata
 )
@@ -29,71 +53,111 @@ from src.chunking.chunker import (
 	chunk_files_and_generate_metadata
 )
 
+from src.chunking.dedup import (
+	restore_collapsed_entries,
+	find_near_duplicates,
+	load_sketches,
+	save_sketches
+)
+
 from src.embedding.embedder import (
 	create_embedding_model,
-	generate_embeddings
+	embedding_dimension,
+	embed_in_batches
 )
 
-from src.vectorstore.faiss_store import (
-	load_or_create_faiss_index,
+from src.embedding.checkpoint import (
+	EmbeddingCheckpoint
+)
+
+from src.vectorstore.store import (
+	load_or_create_index,
+	load_index,
+	index_exists,
+	convert_index,
 	add_to_index,
-	remove_from_faiss_index
+	remove_from_index,
+	persist_index
 )
 
 load_dotenv()
-KNOWLEDGE_BASE_DIR = Path(os.getenv("KNOWLEDGE_BASE_DIR"))
-IGNORE_DIRS = set(os.getenv("IGNORE_DIRS", "").split(","))
 model_name = os.getenv("MODEL")
 
-def main(logger):
+# embeddings of a build in progress, committed batch by batch so a killed build can resume
+EMBED_CACHE_DIR = "embed_cache"
+
+def main(logger, collection_name: str = DEFAULT_COLLECTION):
 	# start timer
 	start_time = time.perf_counter()
 
-	logger.info("Rag pipeline started")
+	collection = configured_collection(collection_name)
 
-	# create a path object to data dir
-	data_dir = ensure_data_dir()
+	logger.info(f"Rag pipeline started for collection '{collection_name}'")
 
-	# create or check metadata.json exists
-	metadata_file = create_metadata_file(data_dir, "metadata.json")
+	# create a path object to the collection's data dir
+	data_dir = ensure_data_dir(collection_name)
 
-	# read the metadata file
-	metadata_file_text = read_file(metadata_file)
+	# every build writes a new snapshot dir and only publishes it once it is complete. queries keep using the previous snapshot meanwhile.
+	with build_lock(data_dir):
+		# index and metadata of a version before snapshots (data/ for the default collection, data/<collection>/ otherwise)
+		import_legacy_data(data_dir, [data_dir, data_dir.parent] if collection_name == DEFAULT_COLLECTION else [data_dir])
 
-	# get the dict with metadata
-	metadata = json_to_dict(metadata_file_text)
+		base_dir = current_snapshot_dir(data_dir)
+		staging_dir = create_staging_dir(data_dir)
 
-	# create an array that will store files to be processed (hash has changed)
-	mds_to_process = []
+		try:
+			changed = build_snapshot(logger, collection, base_dir, staging_dir, data_dir / EMBED_CACHE_DIR)
+		except BaseException:
+			# nothing was published, the previous snapshot stays current
+			discard_staging_dir(staging_dir)
+			raise
 
-	md_files = retrieve_md_filenames(KNOWLEDGE_BASE_DIR, IGNORE_DIRS)
+		if changed:
+			publish_snapshot(data_dir, staging_dir)
+			# everything in the cache is in the snapshot now
+			shutil.rmtree(data_dir / EMBED_CACHE_DIR, ignore_errors=True)
+		else:
+			logger.info("Knowledge base unchanged — keeping the current snapshot.")
+			discard_staging_dir(staging_dir)
 
-	for md_file in md_files:
-		# compute the md5 hash of the md file
-		current_md_hash = hash_file(md_file)
-		
-		# this returns a path without the ../ as a string
-		md_relative_path = str(md_file.relative_to(KNOWLEDGE_BASE_DIR))
+		gc_snapshots(data_dir, SNAPSHOTS_TO_KEEP)
 
-		if needs_processing(md_relative_path, current_md_hash, metadata):
-			mds_to_process.append(md_file)
+	# end timer, count relapsed time
+	end_time = time.perf_counter()
+	elapsed = end_time - start_time
+	logger.info(f'Rag pipeline completed successfully in {elapsed:.9f} seconds.')
+
+def build_snapshot(logger, collection: dict, base_dir: Path | None, staging_dir: Path, cache_dir: Path) -> bool:
+	"""
+	Read the previous snapshot from base_dir (None on the first build), work out what changed in the knowledge base
+	and write the complete new metadata.json, metadata_store.jsonl and index into staging_dir.
+	New embeddings are committed to cache_dir batch by batch, so a build stopped while embedding picks up from there.
+	base_dir is never modified. Returns False if nothing changed.
+	"""
+	manifest = read_manifest(base_dir)
+	index_model_name = indexed_model_name(logger, collection, manifest)
+	dim = manifest.get("dim")
+	model = None
 
-	# write these hashes to the metadata.json file from metadata dict
-	try:
-		save_dict_to_json(metadata_file, metadata)
-	except Exception as e:
-		logger.error(f"❌ Fatal error: {e}")
-		# stop main()
-		return
+	# unlike the model, the backend can change on any build, the index is converted
+	backend = collection.get("backend") or VECTOR_BACKEND
+	index_backend = manifest.get("backend", "faiss") if base_dir else backend
 
-	# create metadata store file path
-	metadata_store_file = create_metadata_file(data_dir, "metadata_store.jsonl")
+	# get the dict with file hashes of the previous build
+	old_file_hashes = json_to_dict(read_file(base_dir / "metadata.json")) if base_dir else {}
+	metadata = dict(old_file_hashes)
 
-	# read contents to a string
-	old_metada_text = read_file(metadata_store_file)
+	md_files, file_hashes, file_stats = scan_knowledge_base(collection, base_dir)
+
+	# create an array that will store files to be processed (hash has changed)
+	mds_to_process = []
+
+	for md_file, (md_relative_path, current_md_hash) in zip(md_files, file_hashes.items()):
+		if needs_processing(md_relative_path, current_md_hash, metadata):
+			mds_to_process.append(md_file)
 
 	# list of dicts holding the old chunks metadata
-	old_metadata = load_jsonl_metadata(old_metada_text)
+	old_metadata = load_jsonl_metadata(read_file(base_dir / "metadata_store.jsonl")) if base_dir else []
 
 	# this will be the list of dicts of chunks and corresponding info.
 	# for now gonna pass this md_files later if there is a way maybe only mds_to_process.
@@ -101,46 +165,130 @@ def main(logger):
 
 	entries_to_delete, entries_to_add = compare_old_new_metadata(old_metadata, current_metadata_store)
 
+	# near-duplicates collapsed by earlier builds have no vector, some may need one now
+	entries_to_add += restore_collapsed_entries(old_metadata, current_metadata_store, entries_to_delete, NEAR_DUP_MODE)
+
+	if base_dir and manifest and backend == index_backend and not entries_to_add and not entries_to_delete and metadata == old_file_hashes:
+		return False
+
+	import numpy as np
+
 	# initialize variables
 	embeddings = None
 	ids = None
-	index = None
-	faiss_index_path = data_dir / "index.faiss"
+
+	# optional stage between chunking and embedding: near-duplicates of chunks that already have a vector aren't embedded
+	reuse_from = {}
+	if NEAR_DUP_MODE != "off":
+		sketches = load_sketches(base_dir / "sketches.npz" if base_dir else None)
+		if entries_to_add:
+			adding = {id(entry) for entry in entries_to_add}
+			indexed_entries = [entry for entry in current_metadata_store if id(entry) not in adding and "duplicate_of" not in entry]
+			entries_to_add, reuse_from = find_near_duplicates(entries_to_add, indexed_entries, sketches, NEAR_DUP_MODE, NEAR_DUP_THRESHOLD)
 
 	# only create embeddings if there are new entries
 	if entries_to_add:
-		import numpy as np
 		# create the embedding model
-		model = create_embedding_model(model_name)
-		chunks = [entry["chunk"] for entry in entries_to_add]
+		model = create_embedding_model(index_model_name)
 		# in order to add the new embeddings let's first get their ids. we need to add to an index (id, embedding) tuples.
 		ids = np.array([e["id"] for e in entries_to_add], dtype=np.int64)
-		embeddings = generate_embeddings(chunks, model)
-		dim = embeddings.shape[1]
+		checkpoint = EmbeddingCheckpoint(cache_dir, index_model_name, embedding_dimension(model))
+		# SIGINT/SIGTERM stop the build after the current batch, nothing is published and the next build resumes
+		with graceful_shutdown() as shutdown:
+			embeddings = embed_in_batches(entries_to_add, model, checkpoint, EMBED_BATCH_SIZE, shutdown)
 	else:
-		logger.info("No new entries to add — skipping embedding and index update.")
+		logger.info("No new entries to add — skipping embedding.")
+
+	# start from the previous snapshot's index, every write below goes to the staging dir.
+	if dim is None and base_dir is None:
+		# first build, the model decides the dimension
+		model = model or create_embedding_model(index_model_name)
+		dim = embedding_dimension(model)
 
-	# only load index if we need to add or delete entries
-	if entries_to_add or entries_to_delete:
-		# default dim if embeddings missing
-		index = load_or_create_faiss_index(faiss_index_path, dim or 384,)
+	# dim is only used when the index is created, an existing index keeps its own. the base snapshot is only read
+	index = load_index(base_dir, index_backend) if base_dir else load_or_create_index(staging_dir, dim, index_backend)
+	if index_backend != backend:
+		index = convert_index(index, backend, staging_dir)
+	if embeddings is not None and embeddings.shape[1] != index.d:
+		raise ValueError(f"{index_model_name} produces {embeddings.shape[1]} dimensional embeddings but the index has dimension {index.d}")
 
 	# add new embeddings to the vector store.
 	if embeddings is not None:
-		add_to_index(ids, embeddings, index, faiss_index_path)
+		add_to_index(ids, embeddings, index, staging_dir)
+
+	if reuse_from:
+		# copy the vector of the canonical chunk, it was either embedded just now or is already in the index
+		embedded_rows = {int(chunk_id): row for row, chunk_id in enumerate(ids)} if ids is not None else {}
+		vectors = [embeddings[embedded_rows[source_id]] if source_id in embedded_rows else index.reconstruct(source_id) for source_id in reuse_from.values()]
+		add_to_index(np.array(list(reuse_from), dtype=np.int64), np.stack(vectors).astype(np.float32), index, staging_dir)
 
 	if entries_to_delete:
 		# get the list of ids to delete
 		ids_to_delete = np.array([entry['id'] for entry in entries_to_delete], dtype=np.int64)
-		remove_from_faiss_index(ids_to_delete, index, faiss_index_path)
+		remove_from_index(ids_to_delete, index, staging_dir)
 
-	# save the new metadata store and overwrite the old one. only save it at this point in case if embedding or writing to index goes wrong we still have old chunks metadata.
-	save_jsonl(current_metadata_store, metadata_store_file)
+	if not index_exists(staging_dir, backend):
+		# only file hashes changed, the index is the same as before
+		persist_index(index, staging_dir)
 
-	# end timer, count relapsed time
-	end_time = time.perf_counter()
-	elapsed = end_time - start_time
-	logger.info(f'Rag pipeline completed successfully in {elapsed:.9f} seconds.')
+	write_manifest(staging_dir, index_model_name, index.d, backend)
+
+	if NEAR_DUP_MODE != "off":
+		save_sketches(staging_dir / "sketches.npz", sketches, [entry["id"] for entry in current_metadata_store if "duplicate_of" not in entry])
+
+	# metadata.json goes into the same snapshot as the index, so a failed build can't leave it claiming files were processed
+	save_dict_to_json(staging_dir / "metadata.json", metadata)
+	save_dict_to_json(staging_dir / "file_stats.json", file_stats)
+	save_jsonl(current_metadata_store, staging_dir / "metadata_store.jsonl")
+
+	return True
+
+def indexed_model_name(logger, collection: dict, manifest: dict) -> str:
+	"""
+	The model to build with: the one the current index was created with, or the configured one on the first build.
+	"""
+	# the index has to keep being built with the model it was created with. switching models is done with `main.py migrate`.
+	configured_model = collection.get("model") or model_name
+	index_model_name = manifest.get("model") or configured_model
+	if index_model_name != configured_model:
+		logger.warning(f"Collection '{collection['name']}' is indexed with {index_model_name} but {configured_model} is configured. "
+			f"Building with {index_model_name}, run `python main.py migrate --model {configured_model}` to switch.")
+	return index_model_name
+
+def scan_knowledge_base(collection: dict, base_dir: Path | None, partition: tuple[int, int] | None = None) -> tuple[list[Path], dict, dict]:
+	"""
+	Scan the collection's knowledge base and hash its files. Returns (md_files, file_hashes, file_stats), sorted by relative path.
+	partition=(i, n) keeps only the files of partition i out of n.
+	"""
+	old_file_hashes = json_to_dict(read_file(base_dir / "metadata.json")) if base_dir else {}
+
+	# size and mtime of every file at the previous build. a file with the same stats keeps its hash without being read again.
+	old_file_stats = json_to_dict(read_file(base_dir / "file_stats.json")) if base_dir and (base_dir / "file_stats.json").exists() else {}
+
+	# the scanner yields files in whatever order directories finish, sort them so chunks keep a stable order
+	scanned_files = sorted(
+		scan_knowledge_files(collection["knowledge_base_dir"], collection["ignore"], collection["extensions"], SCAN_WORKERS, collection.get("ignore_file")),
+		key=lambda scanned: scanned.relative_path
+	)
+	if partition is not None:
+		scanned_files = [scanned for scanned in scanned_files if partition_of(scanned.relative_path, partition[1]) == partition[0]]
+
+	md_files = []
+	file_hashes = {}
+	file_stats = {}
+	for scanned in scanned_files:
+		# this is a path relative to the knowledge base, without the ../
+		md_relative_path = scanned.relative_path
+		md_files.append(Path(scanned.path))
+		file_stats[md_relative_path] = [scanned.size, scanned.mtime_ns]
+
+		if old_file_stats.get(md_relative_path) == file_stats[md_relative_path] and md_relative_path in old_file_hashes:
+			file_hashes[md_relative_path] = old_file_hashes[md_relative_path]
+		else:
+			# compute the md5 hash of the md file
+			file_hashes[md_relative_path] = hash_file(md_files[-1])
+
+	return md_files, file_hashes, file_stats
 
 # --- entry point ---
 if __name__ == "__main__":
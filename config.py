@@ -14,4 +14,30 @@ def setup_logger(debug: bool=False):
 
 load_dotenv()
 KNOWLEDGE_BASE_DIR = Path(os.getenv("KNOWLEDGE_BASE_DIR"))
-IGNORE_DIRS = set(os.getenv("IGNORE_DIRS", "").split(","))
+IGNORE_DIRS = [pattern.strip() for pattern in os.getenv("IGNORE_DIRS", "").split(",") if pattern.strip()]
+# IGNORE_DIRS entries are gitignore style patterns, in order (the last one that matches wins). IGNORE_FILE (relative to the knowledge base, e.g. .gitignore) adds more.
+IGNORE_FILE = os.getenv("IGNORE_FILE") or None
+KNOWLEDGE_EXTENSIONS = tuple(ext.strip() for ext in os.getenv("KNOWLEDGE_EXTENSIONS", ".md").split(",") if ext.strip())
+# directories scanned concurrently, mostly helps on network mounted knowledge bases
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "8"))
+
+# optional json file with named collections (one knowledge base + data dir each). without it there is one "default" collection.
+COLLECTIONS_FILE = Path(os.getenv("COLLECTIONS_FILE", "collections.json"))
+# the query side keeps at most this much index data loaded, least recently used collections are evicted first
+INDEX_MEMORY_BUDGET_MB = float(os.getenv("INDEX_MEMORY_BUDGET_MB", "1024"))
+# "faiss" or "numpy" (exact search on a memory-mapped .npy, no faiss import, good for small knowledge bases). collections can override it.
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "faiss")
+# every build publishes a new snapshot, this many of the newest ones are kept on disk
+SNAPSHOTS_TO_KEEP = int(os.getenv("SNAPSHOTS_TO_KEEP", "2"))
+# builds embed and commit this many chunks at a time, a killed build resumes from the last committed batch
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+# query micro-batching: how long to wait for more concurrent queries and how many to encode/search at once
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_MAX_BATCH = int(os.getenv("QUERY_MAX_BATCH", "32"))
+
+# near-duplicate chunks (minhash/lsh): "off", "reuse" (copy the vector of the similar chunk instead of embedding) or "collapse" (one entry with several sources)
+NEAR_DUP_MODE = os.getenv("NEAR_DUP_MODE", "off")
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+if NEAR_DUP_MODE not in ("off", "reuse", "collapse"):
+	raise ValueError(f"NEAR_DUP_MODE must be off, reuse or collapse, got {NEAR_DUP_MODE!r}")
@@ -1,26 +1,59 @@
 import argparse
+import sys
 from config import setup_logger
+from src.utils.signal_utils import ShutdownRequested
 
 # this will be the entry point. based on arguments passed it will either call the build or query flow
 def main():
 	parser = argparse.ArgumentParser(
 		formatter_class=argparse.RawTextHelpFormatter,
-		usage="python all_main.py {build,query} [--debug] [-h]"
+		usage="python main.py {build,query,migrate,merge} [--collection NAME] [--debug] [-h]"
 	)
 
-	parser.add_argument("mode", choices=["build", "query"])
+	parser.add_argument("mode", choices=["build", "query", "migrate", "merge"])
 	parser.add_argument("--debug", action="store_true", help="Enable debug logging")
+	parser.add_argument("--collection", default="default", help="Name of the collection (knowledge base) to build or query")
+	parser.add_argument("--model", help="migrate: embedding model to re-embed the collection with (default: MODEL from .env)")
+	parser.add_argument("--batch-size", type=int, default=64, help="migrate: chunks embedded and committed per batch")
+	parser.add_argument("--max-rate", type=float, help="migrate: limit re-embedding to this many chunks per second")
+	parser.add_argument("--partitions", type=int, help="build/merge: split the build into this many partitions (build without --partition runs them all locally)")
+	parser.add_argument("--partition", type=int, help="build: only build this partition (0 based) of --partitions, e.g. on one of several machines")
+	parser.add_argument("--run-id", help="build/merge: id shared by all partition jobs of one build, merge refuses partials of other runs")
 	args = parser.parse_args()
 
+	if args.partition is not None and not args.partitions:
+		parser.error("--partition needs --partitions")
+	if args.partition is not None and not args.run_id:
+		parser.error("--partition needs --run-id")
+	if args.mode == "merge" and not args.partitions:
+		parser.error("merge needs --partitions")
+
 	logger = setup_logger(debug=args.debug)
 	logger.debug("Debug mode enabled.")
 
-	if args.mode == "build":
-		import build
-		build.main(logger)
-	elif args.mode == "query":
-		import query
-		query.main(logger)
+	try:
+		if args.mode == "build" and args.partitions:
+			import partition
+			if args.partition is None:
+				partition.build_partitions_locally(logger, args.collection, args.partitions)
+			else:
+				partition.build_partition(logger, args.collection, args.partition, args.partitions, args.run_id)
+		elif args.mode == "build":
+			import build
+			build.main(logger, args.collection)
+		elif args.mode == "query":
+			import query
+			query.main(logger, args.collection)
+		elif args.mode == "migrate":
+			import migrate
+			migrate.main(logger, args.collection, args.model, args.batch_size, args.max_rate)
+		elif args.mode == "merge":
+			import partition
+			partition.merge(logger, args.collection, args.partitions, args.run_id)
+	except ShutdownRequested as e:
+		# the embedded batches are committed, running the same command again continues from there
+		logger.warning(f"{e}, nothing was published. Run the same command again to resume.")
+		sys.exit(128 + e.signum)
 
 # --- entry point ---
 if __name__ == "__main__":
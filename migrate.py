@@ -0,0 +1,170 @@
+import time
+import shutil
+from pathlib import Path
+from dotenv import load_dotenv
+import os
+
+from config import SNAPSHOTS_TO_KEEP
+
+from src.utils.io_utils import (
+	ensure_data_dir,
+	read_file,
+	load_jsonl_metadata
+)
+
+from src.utils.snapshot_utils import (
+	build_lock,
+	current_snapshot_dir,
+	create_staging_dir,
+	publish_snapshot,
+	discard_staging_dir,
+	gc_snapshots,
+	read_manifest,
+	write_manifest
+)
+
+from src.utils.signal_utils import (
+	graceful_shutdown
+)
+
+from src.utils.collection_utils import (
+	DEFAULT_COLLECTION,
+	configured_collection
+)
+
+from src.embedding.embedder import (
+	create_embedding_model,
+	embedding_dimension,
+	embed_texts
+)
+
+from src.embedding.checkpoint import (
+	EmbeddingCheckpoint
+)
+
+from src.vectorstore.store import (
+	load_or_create_index,
+	add_to_index
+)
+
+load_dotenv()
+model_name = os.getenv("MODEL")
+
+# re-embed a collection with a new model next to the live index, then cut over to it with one snapshot swap.
+# queries (and builds) keep using the old snapshot the whole time. safe to kill and rerun, it resumes from the last committed batch.
+
+def main(logger, collection_name: str = DEFAULT_COLLECTION, new_model_name: str | None = None, batch_size: int = 64, max_rate: float | None = None):
+	start_time = time.perf_counter()
+	new_model_name = new_model_name or model_name
+
+	data_dir = ensure_data_dir(configured_collection(collection_name)["name"])
+	if current_snapshot_dir(data_dir) is None:
+		logger.error(f"Collection '{collection_name}' has no published snapshot, run a build with MODEL={new_model_name} instead.")
+		return
+
+	old_model_name = read_manifest(current_snapshot_dir(data_dir)).get("model") or model_name
+	if old_model_name == new_model_name:
+		logger.info(f"Collection '{collection_name}' is already indexed with {new_model_name}, nothing to migrate.")
+		return
+
+	logger.info(f"Migrating collection '{collection_name}' from {old_model_name} to {new_model_name}")
+
+	model = create_embedding_model(new_model_name)
+	dim = embedding_dimension(model)
+	checkpoint = EmbeddingCheckpoint(data_dir / "migrations" / new_model_name.replace("/", "__"), new_model_name, dim)
+
+	# the long part, runs without any lock against whatever snapshot is published right now. SIGINT/SIGTERM stop it after the current batch
+	with graceful_shutdown() as shutdown:
+		embed_missing_chunks(logger, current_snapshot_dir(data_dir), model, checkpoint, batch_size, max_rate, shutdown)
+
+	# cut over. with the build lock held no new snapshot can appear, so only chunks added since the first pass are left to embed.
+	# a build running right now is waited for, failing here would throw away hours of re-embedding
+	logger.info("Waiting for the build lock to cut over.")
+	with build_lock(data_dir, timeout=None):
+		base_dir = current_snapshot_dir(data_dir)
+		embed_missing_chunks(logger, base_dir, model, checkpoint, batch_size, None)
+
+		staging_dir = create_staging_dir(data_dir)
+		try:
+			write_migrated_snapshot(logger, base_dir, staging_dir, checkpoint, new_model_name, dim)
+		except BaseException:
+			discard_staging_dir(staging_dir)
+			raise
+
+		publish_snapshot(data_dir, staging_dir)
+		gc_snapshots(data_dir, SNAPSHOTS_TO_KEEP)
+
+	checkpoint.clear()
+
+	elapsed = time.perf_counter() - start_time
+	logger.info(f"Migration to {new_model_name} completed in {elapsed:.2f} seconds.")
+
+def embed_missing_chunks(logger, snapshot_dir: Path, model, checkpoint: EmbeddingCheckpoint, batch_size: int, max_rate: float | None, shutdown=None) -> None:
+	"""
+	Embed every chunk of the snapshot that isn't in the checkpoint yet, committing one batch at a time.
+	max_rate caps the throughput in chunks per second so a migration doesn't starve the query side.
+	shutdown (from graceful_shutdown) is checked between batches.
+	"""
+	import numpy as np
+
+	entries = load_jsonl_metadata(read_file(snapshot_dir / "metadata_store.jsonl"))
+	done = checkpoint.committed_ids()
+
+	# identical chunks in different files share an id, they only need one embedding. collapsed near-duplicates have none.
+	todo = list({entry["id"]: entry for entry in entries if entry["id"] not in done and "duplicate_of" not in entry}.values())
+	if not todo:
+		return
+
+	logger.info(f"{len(done)} chunks already migrated, {len(todo)} to go.")
+
+	for start in range(0, len(todo), batch_size):
+		if shutdown is not None:
+			shutdown.check()
+
+		batch_start = time.perf_counter()
+		batch = todo[start:start + batch_size]
+
+		embeddings = embed_texts([entry["chunk"] for entry in batch], model)
+		checkpoint.commit(np.array([entry["id"] for entry in batch], dtype=np.int64), embeddings)
+		logger.info(f"Migrated {min(start + batch_size, len(todo))}/{len(todo)} chunks.")
+
+		if max_rate:
+			# sleep off whatever is left of this batch's time slot
+			time.sleep(max(0.0, len(batch) / max_rate - (time.perf_counter() - batch_start)))
+
+def write_migrated_snapshot(logger, base_dir: Path, staging_dir: Path, checkpoint: EmbeddingCheckpoint, new_model_name: str, dim: int) -> None:
+	"""
+	Write a snapshot with the same chunks as base_dir but an index made of the checkpointed embeddings.
+	"""
+	import numpy as np
+
+	entries = load_jsonl_metadata(read_file(base_dir / "metadata_store.jsonl"))
+	backend = read_manifest(base_dir).get("backend", "faiss")
+	wanted = np.array(sorted({entry["id"] for entry in entries if "duplicate_of" not in entry}), dtype=np.int64)
+
+	ids, embeddings = checkpoint.load()
+	# drop chunks deleted by builds during the migration, and keep one vector per id
+	ids, first = np.unique(ids, return_index=True)
+	embeddings = embeddings[first]
+	keep = np.isin(ids, wanted)
+	ids, embeddings = ids[keep], embeddings[keep]
+
+	if ids.size != wanted.size:
+		raise RuntimeError(f"Checkpoint has {ids.size} of {wanted.size} chunks, refusing to cut over")
+
+	index = load_or_create_index(staging_dir, dim, backend)
+	if ids.size:
+		add_to_index(ids, embeddings, index, staging_dir)
+
+	# chunks and file hashes don't change, only the vectors do
+	shutil.copy2(base_dir / "metadata.json", staging_dir / "metadata.json")
+	shutil.copy2(base_dir / "metadata_store.jsonl", staging_dir / "metadata_store.jsonl")
+	if (base_dir / "sketches.npz").exists():
+		shutil.copy2(base_dir / "sketches.npz", staging_dir / "sketches.npz")
+	write_manifest(staging_dir, new_model_name, dim, backend)
+
+	logger.info(f"Wrote migrated index with {index.ntotal} vectors of dimension {dim}.")
+
+# --- entry point ---
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,343 @@
+import os
+import signal
+import sys
+import time
+import shutil
+import multiprocessing
+from pathlib import Path
+
+from config import VECTOR_BACKEND, SNAPSHOTS_TO_KEEP, EMBED_BATCH_SIZE
+
+from src.utils.io_utils import (
+	ensure_data_dir,
+	read_file,
+	json_to_dict,
+	save_dict_to_json,
+	load_jsonl_metadata,
+	save_jsonl
+)
+
+from src.utils.snapshot_utils import (
+	build_lock,
+	current_snapshot_dir,
+	current_snapshot_version,
+	create_staging_dir,
+	publish_snapshot,
+	discard_staging_dir,
+	gc_snapshots,
+	read_manifest,
+	write_manifest
+)
+
+from src.utils.signal_utils import (
+	ShutdownRequested,
+	graceful_shutdown,
+	stop_when_parent_stops
+)
+
+from src.utils.collection_utils import (
+	DEFAULT_COLLECTION,
+	configured_collection
+)
+
+from src.chunking.chunker import (
+	chunk_files_and_generate_metadata
+)
+
+from src.embedding.embedder import (
+	create_embedding_model,
+	embedding_dimension,
+	embed_in_batches
+)
+
+from src.embedding.checkpoint import (
+	EmbeddingCheckpoint
+)
+
+from src.vectorstore.store import (
+	load_or_create_index,
+	load_index,
+	index_exists,
+	index_contents,
+	index_vectors,
+	add_to_index,
+	persist_index
+)
+
+from build import indexed_model_name, scan_knowledge_base
+
+# a full build split over n independent jobs. job i takes the files whose path hashes to partition i and writes a partial
+# metadata store and index to data/<collection>/partials/<n>/<i>/. `merge` combines all n partials into one new snapshot.
+# jobs only share the data dir, so they can be local processes or run on different machines with data/ on a shared file system.
+# all jobs of one build get the same run id. a partial records it and the snapshot it started from, merge refuses partials
+# of another run or base, so a leftover partial can't bring back files that changed since.
+
+PARTIALS_DIR = "partials"
+
+def partials_dir(data_dir: Path, partitions: int) -> Path:
+	return data_dir / PARTIALS_DIR / str(partitions)
+
+def build_partition(logger, collection_name: str, partition: int, partitions: int, run_id: str) -> Path:
+	"""
+	Build partition `partition` of `partitions` for run `run_id` and return its directory. Chunks that are unchanged since
+	the current snapshot keep their vector, everything else in the partition is embedded. Rerunning a job replaces its partial.
+	"""
+	import numpy as np
+
+	if not 0 <= partition < partitions:
+		raise ValueError(f"Partition {partition} is out of range for {partitions} partitions")
+	if not run_id:
+		raise ValueError("Partition jobs need a run id shared by all jobs of the build")
+
+	start_time = time.perf_counter()
+	collection = configured_collection(collection_name)
+	data_dir = ensure_data_dir(collection_name)
+	logger.info(f"Building partition {partition}/{partitions} of collection '{collection_name}'")
+
+	# every job reads the same published snapshot, it is only used to skip work
+	base_dir = current_snapshot_dir(data_dir)
+	manifest = read_manifest(base_dir)
+	index_model_name = indexed_model_name(logger, collection, manifest)
+	backend = collection.get("backend") or VECTOR_BACKEND
+	dim = manifest.get("dim")
+	model = None
+
+	md_files, file_hashes, file_stats = scan_knowledge_base(collection, base_dir, (partition, partitions))
+	entries = chunk_files_and_generate_metadata(md_files)
+	logger.info(f"Partition {partition}/{partitions} has {len(md_files)} files and {len(entries)} chunks.")
+
+	# identical chunks share an id and a vector
+	unique_entries = list({entry["id"]: entry for entry in entries}.values())
+	ids = np.array([entry["id"] for entry in unique_entries], dtype=np.int64)
+
+	# ids are content hashes, so a chunk that has a vector in the current snapshot can keep it.
+	# only this partition's vectors are copied, all jobs read the same base index
+	reused_ids = np.empty(0, dtype=np.int64)
+	reused_vectors = None
+	if base_dir and ids.size:
+		reused_ids, reused_vectors = index_vectors(load_index(base_dir, manifest.get("backend", "faiss")), ids)
+
+	reused = set(reused_ids.tolist())
+	todo = [entry for entry in unique_entries if entry["id"] not in reused]
+	parts_dir = partials_dir(data_dir, partitions)
+	cache_dir = parts_dir / f".embed-cache-{partition}"
+	embeddings = None
+	if todo:
+		logger.info(f"Reusing {reused_ids.size} vectors from the current snapshot, embedding {len(todo)} chunks.")
+		model = create_embedding_model(index_model_name)
+		# committed batches stay until the merge, so rerunning a stopped (or finished) job doesn't embed them again
+		checkpoint = EmbeddingCheckpoint(cache_dir, index_model_name, embedding_dimension(model))
+		with graceful_shutdown() as shutdown:
+			embeddings = embed_in_batches(todo, model, checkpoint, EMBED_BATCH_SIZE, shutdown)
+
+	if dim is None:
+		# nothing was published yet, the model decides the dimension
+		dim = embeddings.shape[1] if embeddings is not None else embedding_dimension(model or create_embedding_model(index_model_name))
+
+	# write the partial next to the others and rename it into place once complete, merge only looks at complete ones
+	parts_dir.mkdir(parents=True, exist_ok=True)
+	work_dir = parts_dir / f".staging-{partition}-{time.time_ns()}"
+	work_dir.mkdir()
+
+	try:
+		index = load_or_create_index(work_dir, dim, backend)
+		if reused_ids.size:
+			add_to_index(reused_ids, reused_vectors.astype(np.float32), index, work_dir)
+		if embeddings is not None:
+			add_to_index(np.array([entry["id"] for entry in todo], dtype=np.int64), embeddings, index, work_dir)
+		if not index_exists(work_dir, backend):
+			persist_index(index, work_dir)
+
+		write_manifest(work_dir, index_model_name, index.d, backend, run=run_id, base=base_dir.name if base_dir else None)
+		save_dict_to_json(work_dir / "metadata.json", file_hashes)
+		save_dict_to_json(work_dir / "file_stats.json", file_stats)
+		save_jsonl(entries, work_dir / "metadata_store.jsonl")
+
+		partial_dir = parts_dir / str(partition)
+		shutil.rmtree(partial_dir, ignore_errors=True)
+		work_dir.rename(partial_dir)
+	except BaseException:
+		shutil.rmtree(work_dir, ignore_errors=True)
+		raise
+
+	elapsed = time.perf_counter() - start_time
+	logger.info(f"Partition {partition}/{partitions} written to {partial_dir} in {elapsed:.2f} seconds.")
+	return partial_dir
+
+def build_partitions_locally(logger, collection_name: str, partitions: int) -> None:
+	"""
+	Run all partition jobs as local processes, then merge them.
+	"""
+	run_id = f"local-{time.time_ns()}"
+	stop_signal = multiprocessing.Value("i", 0)
+	jobs = [
+		multiprocessing.Process(
+			target=run_job,
+			args=(stop_signal, os.getpid(), build_partition, logger, collection_name, partition, partitions, run_id),
+			name=f"partition-{partition}"
+		)
+		for partition in range(partitions)
+	]
+	for job in jobs:
+		job.start()
+	wait_for_jobs(jobs, stop_signal)
+
+	merge(logger, collection_name, partitions, run_id)
+
+def run_job(stop_signal, parent_pid: int, function, *args) -> None:
+	"""
+	Target of a job process started by build_partitions_locally, runs function(*args). A job that stops on a signal
+	exits with 128 + the signal number like main.py does.
+	"""
+	stop_when_parent_stops(stop_signal, parent_pid)
+	try:
+		function(*args)
+	except ShutdownRequested as e:
+		sys.exit(128 + e.signum)
+
+def wait_for_jobs(jobs: list[multiprocessing.Process], stop_signal) -> None:
+	"""
+	Wait for started job processes that run run_job(stop_signal, <this pid>, ...). SIGINT/SIGTERM received by this
+	process are passed on through stop_signal: each job stops after its current batch and ShutdownRequested is raised
+	here once they all exited. Rerunning reuses every batch the jobs committed. A second signal interrupts the jobs
+	right away. Raises RuntimeError if a job failed.
+	"""
+	def forward(signum):
+		if stop_signal.value:
+			for job in jobs:
+				try:
+					os.kill(job.pid, signal.SIGINT)
+				except ProcessLookupError:
+					pass
+		stop_signal.value = signum
+
+	try:
+		with graceful_shutdown(on_signal=forward) as shutdown:
+			for job in jobs:
+				job.join()
+	finally:
+		# after a second signal, don't leave before the interrupted jobs are gone
+		for job in jobs:
+			job.join()
+	shutdown.check()
+
+	failed = [job.name for job in jobs if job.exitcode != 0]
+	if failed:
+		raise RuntimeError(f"Jobs {failed} failed, see their errors above")
+
+def merge(logger, collection_name: str = DEFAULT_COLLECTION, partitions: int = 1, run_id: str | None = None) -> None:
+	"""
+	Combine the partials of all `partitions` jobs into one snapshot and publish it.
+	With run_id only partials of that run are accepted, without it the partials must at least agree on one.
+	"""
+	start_time = time.perf_counter()
+	data_dir = ensure_data_dir(configured_collection(collection_name)["name"])
+	parts_dir = partials_dir(data_dir, partitions)
+
+	missing = [partition for partition in range(partitions) if not (parts_dir / str(partition)).is_dir()]
+	if missing:
+		raise RuntimeError(f"Partitions {missing} of {partitions} are not built yet, run `python main.py build --partition I --partitions {partitions} --run-id RUN` for them")
+
+	partial_dirs = [parts_dir / str(partition) for partition in range(partitions)]
+	logger.info(f"Merging {partitions} partitions of collection '{collection_name}'")
+
+	with build_lock(data_dir):
+		# the jobs must have started from the snapshot that is still current, otherwise a build published in between would be undone
+		base_version = current_snapshot_version(data_dir)
+		staging_dir = create_staging_dir(data_dir)
+		try:
+			merge_partials(logger, partial_dirs, staging_dir, run_id, base_version)
+		except BaseException:
+			discard_staging_dir(staging_dir)
+			raise
+
+		publish_snapshot(data_dir, staging_dir)
+		gc_snapshots(data_dir, SNAPSHOTS_TO_KEEP)
+
+	# the partials (and their embedding caches) are in the snapshot now
+	shutil.rmtree(parts_dir, ignore_errors=True)
+	try:
+		# unless there are partials of another partition count
+		parts_dir.parent.rmdir()
+	except OSError:
+		pass
+
+	elapsed = time.perf_counter() - start_time
+	logger.info(f"Merged {partitions} partitions in {elapsed:.2f} seconds.")
+
+def merge_partials(logger, partial_dirs: list[Path], staging_dir: Path, run_id: str | None = None, base_version: str | None = None) -> None:
+	"""
+	Write the union of the partials' metadata and indexes into staging_dir.
+
+	All partials must come from the same run (run_id if given) and have started from the snapshot base_version
+	(None: nothing was published yet).
+
+	A file may only belong to one partial and an id may only stand for one chunk: ids are truncated content hashes,
+	the same id with a different chunk hash is a collision and fails the merge. The same chunk in several partials
+	(identical text in files of different partitions) is fine and keeps a single vector.
+	"""
+	import numpy as np
+
+	manifests = [read_manifest(partial_dir) for partial_dir in partial_dirs]
+	settings = {(manifest.get("model"), manifest.get("dim"), manifest.get("backend", "faiss")) for manifest in manifests}
+	if len(settings) != 1:
+		raise RuntimeError(f"Partials were built with different models or backends: {sorted(settings, key=str)}")
+	model_name, dim, backend = settings.pop()
+
+	runs = {manifest.get("run") for manifest in manifests}
+	if len(runs) != 1 or (run_id is not None and runs != {run_id}):
+		raise RuntimeError(f"Partials come from different runs {sorted(runs, key=str)}" + (f", expected {run_id}" if run_id else "") + ", rebuild the stale ones")
+	stale = [partial_dir.name for partial_dir, manifest in zip(partial_dirs, manifests) if manifest.get("base") != base_version]
+	if stale:
+		raise RuntimeError(f"Partials {stale} were built from another snapshot than the current one ({base_version}), rebuild them")
+
+	metadata = {}
+	file_stats = {}
+	metadata_store = []
+	hash_of_id = {}
+	all_ids = []
+	all_vectors = []
+
+	for partial_dir in partial_dirs:
+		file_hashes = json_to_dict(read_file(partial_dir / "metadata.json"))
+		overlap = metadata.keys() & file_hashes.keys()
+		if overlap:
+			raise RuntimeError(f"Files {sorted(overlap)[:5]} are in more than one partial, were the partials built with different partition counts?")
+		metadata.update(file_hashes)
+		file_stats.update(json_to_dict(read_file(partial_dir / "file_stats.json")))
+
+		entries = load_jsonl_metadata(read_file(partial_dir / "metadata_store.jsonl"))
+		for entry in entries:
+			known_hash = hash_of_id.setdefault(entry["id"], entry["hash"])
+			if known_hash != entry["hash"]:
+				raise RuntimeError(f"Id collision: chunk id {entry['id']} stands for chunks {known_hash} and {entry['hash']} ({partial_dir.name}/{entry['source']})")
+		metadata_store.extend(entries)
+
+		ids, vectors = index_contents(load_index(partial_dir, backend))
+		missing = {entry["id"] for entry in entries} - set(ids.tolist())
+		if missing:
+			raise RuntimeError(f"Partial {partial_dir} is missing vectors for {len(missing)} of its chunks")
+		all_ids.append(ids)
+		all_vectors.append(vectors)
+
+	ids = np.concatenate(all_ids) if all_ids else np.empty(0, dtype=np.int64)
+	vectors = np.concatenate(all_vectors) if all_vectors else np.empty((0, dim), dtype=np.float32)
+
+	# the id check above guarantees duplicated ids carry the same chunk, keep one vector each
+	ids, first = np.unique(ids, return_index=True)
+	vectors = vectors[first]
+	if len(first) != sum(part.size for part in all_ids):
+		logger.info(f"{sum(part.size for part in all_ids) - len(first)} chunks appear in more than one partition, keeping one vector each.")
+
+	index = load_or_create_index(staging_dir, dim, backend)
+	if ids.size:
+		add_to_index(ids, vectors.astype(np.float32), index, staging_dir)
+	else:
+		persist_index(index, staging_dir)
+
+	write_manifest(staging_dir, model_name, dim, backend)
+	save_dict_to_json(staging_dir / "metadata.json", metadata)
+	save_dict_to_json(staging_dir / "file_stats.json", file_stats)
+	save_jsonl(metadata_store, staging_dir / "metadata_store.jsonl")
+
+	logger.info(f"Merged index has {index.ntotal} vectors from {len(metadata)} files.")
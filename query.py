@@ -1,73 +1,99 @@
+import asyncio
 import json
 import numpy as np
 from dotenv import load_dotenv
 import os
 
+from config import QUERY_BATCH_WINDOW_MS, QUERY_MAX_BATCH, INDEX_MEMORY_BUDGET_MB
+
 from src.utils.io_utils import (
 	ensure_data_dir,
 	load_jsonl_metadata,
-	read_file,
-	create_metadata_file
+	read_file
+)
+
+from src.utils.snapshot_utils import (
+	snapshot_dir
 )
 
-from src.embedding.embedder import (
-	create_embedding_model,
-	embed_text
+from src.vectorstore.index_cache import (
+	IndexCache
 )
 
-from src.vectorstore.faiss_store import (
-	load_or_create_faiss_index
+from src.utils.collection_utils import (
+	DEFAULT_COLLECTION,
+	configured_collection
 )
 
-from src.vectorstore.retrieval import (
-	retrieve_top_k
+from src.serving.batcher import (
+	QueryBatcher
 )
 
-def main(logger):
+async def run_queries(questions: list[str], get_index_and_model, k: int, collection: str = DEFAULT_COLLECTION) -> list[tuple]:
+	"""
+	Send all questions through the micro-batching front end concurrently. Returns a (D, I, snapshot version) tuple per question, in order.
+	"""
+	async with QueryBatcher(get_index_and_model, max_batch_size=QUERY_MAX_BATCH, max_wait_ms=QUERY_BATCH_WINDOW_MS, default_k=k) as batcher:
+		return await asyncio.gather(*(batcher.query(question, collection=collection) for question in questions))
+
+def load_snapshot_metadata(data_dir, version: str) -> tuple[list[dict], dict]:
+	"""
+	Return (metadata store, {id: sources}) of a snapshot.
+	"""
+	metadata_store_file = snapshot_dir(data_dir, version) / "metadata_store.jsonl"
+
+	# read contents to a string
+	metada_text = read_file(metadata_store_file)
+
+	metadata = load_jsonl_metadata(metada_text)
+
+	# near-duplicates collapsed into one entry are shown as extra sources of it
+	sources = {}
+	for entry in metadata:
+		sources.setdefault(entry.get("duplicate_of", entry["id"]), []).append(entry["source"])
+
+	return metadata, sources
+
+def main(logger, collection_name: str = DEFAULT_COLLECTION):
 	# take a question, embed it with the same model as the index store uses.
 	# pass this to a top_k search function to get the top_k neighbours of the query from our knowledge base index store
 	# take back all those and the query embedding and convert back to the original texts
 	# pass the text to the llm
 	# print the result on the screen.
-	dim = 384
 	k = 10
 
-	# this is for which model to use
+	# unknown names fail here instead of creating an empty data dir
+	configured_collection(collection_name)
+
+	# the model comes from the snapshot's manifest, MODEL is only the fallback for indexes built before manifests existed
 	load_dotenv()
 	model_name = os.getenv("MODEL")
 
-	# take a question, embed it with the same model as the index store uses.
-	query = "protocols tcp icmp"
-	model = create_embedding_model(model_name)
-	vector = embed_text(query, model)
-
-	# load the local index
-
-	data_dir = ensure_data_dir()
+	# take the questions, they get embedded with the same model as the index store uses.
+	queries = ["protocols tcp icmp"]
 
-	faiss_index_path = data_dir / "index.faiss"
+	# indexes are loaded lazily per collection, collections using the same model share it
+	index_cache = IndexCache(INDEX_MEMORY_BUDGET_MB, default_model=model_name)
 
-	index = load_or_create_faiss_index(faiss_index_path, dim)
+	results = asyncio.run(run_queries(queries, index_cache.get_index_and_model, k, collection_name))
 
-	D, I = retrieve_top_k(vector, index, k)
+	# every result carries the version of the snapshot it was searched in, a build may have published a newer one meanwhile
+	metadata_by_version = {}
 
-	# create metadata store file path
-	metadata_store_file = create_metadata_file(data_dir, "metadata_store.jsonl")
-
-	# read contents to a string
-	metada_text = read_file(metadata_store_file)
-
-	metadata = load_jsonl_metadata(metada_text)
+	for query, (D, I, version) in zip(queries, results):
+		if version not in metadata_by_version:
+			metadata_by_version[version] = load_snapshot_metadata(ensure_data_dir(collection_name), version)
+		metadata, sources = metadata_by_version[version]
 
-	logger.info(f"\n=== Top {k} Matches ===")
-	for rank, (dist, idx) in enumerate(zip(D[0], I[0]), start=1):
-		entry = next((e for e in metadata if e["id"] == idx), None)
-		if entry:
-			logger.info(f"#{rank} — ID: {idx}, distance: {dist:.4f}")
-			# print first 200 chars
-			logger.info(f"Text: \n {entry['chunk'][:200]}...")
-		else:
-			logger.info(f"#{rank} — ID: {idx} (no metadata found)")
+		logger.info(f"\n=== Top {k} Matches for '{query}' ===")
+		for rank, (dist, idx) in enumerate(zip(D[0], I[0]), start=1):
+			entry = next((e for e in metadata if e["id"] == idx), None)
+			if entry:
+				logger.info(f"#{rank} — ID: {idx}, distance: {dist:.4f}, sources: {', '.join(dict.fromkeys(sources[entry['id']]))}")
+				# print first 200 chars
+				logger.info(f"Text: \n {entry['chunk'][:200]}...")
+			else:
+				logger.info(f"#{rank} — ID: {idx} (no metadata found)")
 
 if __name__ == "__main__":
 	main()
@@ -0,0 +1,169 @@
+import logging
+import hashlib
+
+logger = logging.getLogger(__name__)
+
+# near-duplicate detection between chunking and embedding.
+# a chunk is sketched with MinHash over its word shingles, LSH buckets the sketches so only chunks that share a band
+# are compared, and the estimated jaccard similarity of the sketches decides if they are near-duplicates.
+
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_SIZE = 5
+# mersenne prime, keeps (a * x + b) inside uint64 for 32 bit shingle hashes
+_PRIME = (1 << 31) - 1
+
+_permutations = None
+
+def _get_permutations():
+	# fixed seed, sketches are stored in snapshots and have to be comparable between builds
+	global _permutations
+	if _permutations is None:
+		import numpy as np
+		rng = np.random.default_rng(1)
+		_permutations = (
+			rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.uint64),
+			rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64),
+		)
+	return _permutations
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[str]:
+	"""
+	Word shingles (overlapping runs of `size` words) of a lowercased chunk.
+	"""
+	words = text.lower().split()
+	if len(words) <= size:
+		return {" ".join(words)}
+	return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def minhash_signature(text: str) -> "np.ndarray":
+	import numpy as np
+
+	a, b = _get_permutations()
+	hashes = np.fromiter(
+		(int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles(text)),
+		dtype=np.uint64
+	)
+	return ((a[:, None] * hashes[None, :] + b[:, None]) % _PRIME).min(axis=1)
+
+def estimate_similarity(signature_a: "np.ndarray", signature_b: "np.ndarray") -> float:
+	"""
+	Fraction of equal minhashes, an estimate of the jaccard similarity of the two chunks' shingles.
+	"""
+	return float((signature_a == signature_b).mean())
+
+class MinHashLSH:
+	"""
+	Splits each signature into bands, chunks that have an identical band end up in the same bucket and become candidates.
+	With 16 bands of 4 rows a pair with similarity 0.8 is a candidate with ~99.9% probability, one with 0.3 with ~12%.
+	"""
+
+	def __init__(self, bands: int = BANDS):
+		self.bands = bands
+		self.rows = NUM_PERM // bands
+		self._buckets = [{} for _ in range(bands)]
+		self._signatures = {}
+
+	def _band_keys(self, signature):
+		for band in range(self.bands):
+			yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+	def insert(self, key: int, signature) -> None:
+		self._signatures[key] = signature
+		for band, band_key in self._band_keys(signature):
+			self._buckets[band].setdefault(band_key, []).append(key)
+
+	def query(self, signature, threshold: float) -> int | None:
+		"""
+		Return the key of the most similar inserted chunk with a similarity of at least threshold, or None.
+		"""
+		candidates = set()
+		for band, band_key in self._band_keys(signature):
+			candidates.update(self._buckets[band].get(band_key, ()))
+
+		best_key, best_similarity = None, threshold
+		for key in candidates:
+			similarity = estimate_similarity(signature, self._signatures[key])
+			if similarity >= best_similarity:
+				best_key, best_similarity = key, similarity
+		return best_key
+
+def restore_collapsed_entries(old_metadata: list[dict], current_metadata: list[dict], entries_to_delete: list[dict], mode: str) -> list[dict]:
+	"""
+	Chunks are re-generated every build, so carry `duplicate_of` over from the previous metadata store.
+	Returns the collapsed entries that need a vector of their own again: their canonical chunk was deleted,
+	or collapsing was turned off.
+	"""
+	duplicate_of = {entry["hash"]: entry["duplicate_of"] for entry in old_metadata if "duplicate_of" in entry}
+	if not duplicate_of:
+		return []
+
+	deleted_ids = {entry["id"] for entry in entries_to_delete}
+	to_add = []
+	for entry in current_metadata:
+		canonical_id = duplicate_of.get(entry["hash"])
+		if canonical_id is None:
+			continue
+		if mode == "collapse" and canonical_id not in deleted_ids:
+			entry["duplicate_of"] = canonical_id
+		else:
+			to_add.append(entry)
+
+	if to_add:
+		logger.info(f"{len(to_add)} collapsed chunks lost their canonical chunk, embedding them again.")
+	return to_add
+
+def find_near_duplicates(entries_to_add: list[dict], indexed_entries: list[dict], sketches: dict, mode: str, threshold: float) -> tuple[list[dict], dict]:
+	"""
+	Compare new chunks against the chunks that already have a vector (and against each other).
+
+	sketches: id -> minhash signature, filled in for every chunk that ends up with a vector.
+	mode "reuse": a near-duplicate gets the vector of its canonical chunk copied instead of being embedded.
+	mode "collapse": a near-duplicate gets `duplicate_of` set and no vector, queries show it as another source of the canonical chunk.
+
+	Returns (entries that still need embedding, {new id: id to copy the vector from} for reuse mode).
+	"""
+	lsh = MinHashLSH()
+	for entry in indexed_entries:
+		if entry["id"] not in sketches:
+			sketches[entry["id"]] = minhash_signature(entry["chunk"])
+		lsh.insert(entry["id"], sketches[entry["id"]])
+
+	to_embed = []
+	reuse_from = {}
+	for entry in entries_to_add:
+		signature = minhash_signature(entry["chunk"])
+		canonical_id = lsh.query(signature, threshold)
+
+		if canonical_id is None or canonical_id == entry["id"]:
+			# new content, later chunks can be near-duplicates of it
+			to_embed.append(entry)
+			sketches[entry["id"]] = signature
+			lsh.insert(entry["id"], signature)
+		elif mode == "collapse":
+			entry["duplicate_of"] = canonical_id
+		else:
+			reuse_from[entry["id"]] = canonical_id
+			sketches[entry["id"]] = signature
+
+	logger.info(f"Near-duplicate stage ({mode}): {len(entries_to_add) - len(to_embed)} of {len(entries_to_add)} new chunks are near-duplicates.")
+	return to_embed, reuse_from
+
+def load_sketches(sketches_file) -> dict:
+	import numpy as np
+
+	if sketches_file is None or not sketches_file.exists():
+		return {}
+	with np.load(sketches_file) as data:
+		return {int(i): signature for i, signature in zip(data["ids"], data["signatures"])}
+
+def save_sketches(sketches_file, sketches: dict, ids) -> None:
+	"""
+	Store the sketches of the given ids (the chunks that have a vector), so the next build doesn't recompute them.
+	"""
+	import numpy as np
+
+	ids = [i for i in dict.fromkeys(ids) if i in sketches]
+	signatures = np.array([sketches[i] for i in ids], dtype=np.uint64).reshape(len(ids), NUM_PERM)
+	with open(sketches_file, "wb") as f:
+		np.savez(f, ids=np.array(ids, dtype=np.int64), signatures=signatures)
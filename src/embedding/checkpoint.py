@@ -0,0 +1,77 @@
+from pathlib import Path
+import logging
+import json
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCheckpoint:
+	"""
+	Durable, append-only store of embedded batches so long embedding runs can resume after a crash.
+
+	Each committed batch is one `batch-<n>.npz` file with `ids` and `embeddings`, written to a temp file
+	and renamed, so a batch is either fully on disk or not at all. `checkpoint.json` records the model
+	the vectors were made with; opening the checkpoint with a different model starts from scratch.
+	"""
+
+	def __init__(self, checkpoint_dir: Path, model_name: str, dim: int):
+		self.checkpoint_dir = checkpoint_dir
+		self.model_name = model_name
+		self.dim = dim
+		self._info_file = checkpoint_dir / "checkpoint.json"
+
+		info = json.loads(self._info_file.read_text(encoding="utf-8")) if self._info_file.exists() else None
+		if info and (info.get("model") != model_name or info.get("dim") != dim):
+			logger.info(f"Checkpoint in {checkpoint_dir} was made with {info.get('model')}, starting over")
+			self.clear()
+			info = None
+
+		if info is None:
+			checkpoint_dir.mkdir(parents=True, exist_ok=True)
+			self._info_file.write_text(json.dumps({"model": model_name, "dim": dim}), encoding="utf-8")
+
+	def _batch_files(self) -> list[Path]:
+		return sorted(self.checkpoint_dir.glob("batch-*.npz"))
+
+	def load(self) -> tuple["np.ndarray", "np.ndarray"]:
+		"""
+		Return (ids, embeddings) of every committed batch.
+		"""
+		import numpy as np
+
+		all_ids = [np.empty(0, dtype=np.int64)]
+		all_embeddings = [np.empty((0, self.dim), dtype=np.float32)]
+		for batch_file in self._batch_files():
+			with np.load(batch_file) as batch:
+				all_ids.append(batch["ids"])
+				all_embeddings.append(batch["embeddings"])
+
+		return np.concatenate(all_ids), np.concatenate(all_embeddings)
+
+	def committed_ids(self) -> set[int]:
+		import numpy as np
+
+		ids = set()
+		for batch_file in self._batch_files():
+			with np.load(batch_file) as batch:
+				ids.update(int(i) for i in batch["ids"])
+		return ids
+
+	def commit(self, ids: "np.ndarray", embeddings: "np.ndarray") -> None:
+		import numpy as np
+
+		batch_number = len(self._batch_files()) + 1
+		batch_file = self.checkpoint_dir / f"batch-{batch_number:06d}.npz"
+		tmp_file = self.checkpoint_dir / f"batch-{batch_number:06d}.tmp"
+
+		with tmp_file.open("wb") as f:
+			np.savez(f, ids=np.asarray(ids, dtype=np.int64), embeddings=np.asarray(embeddings, dtype=np.float32))
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(tmp_file, batch_file)
+
+		logger.debug(f"Committed batch {batch_number} ({len(ids)} embeddings) to {self.checkpoint_dir}")
+
+	def clear(self) -> None:
+		shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
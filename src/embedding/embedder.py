@@ -12,9 +12,20 @@ def create_embedding_model(name: str):
 	logger.info(f"Created embedding model: {name}")
 	return model
 
+def embedding_dimension(model) -> int:
+	return model.get_sentence_embedding_dimension()
+
 def embed_text(text: str, model):
 	return generate_embeddings([text], model)
 
+def embed_texts(texts: list[str], model) -> "np.ndarray":
+	"""
+	Embed a batch of query strings in one model.encode call. Unlike generate_embeddings this is quiet (no progress bar, debug logging only) since it runs for every query batch.
+	"""
+	embeddings = model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+	logger.debug(f"Embedded a batch of {len(texts)} queries, shape: {embeddings.shape}")
+	return embeddings
+
 def generate_embeddings(chunks: list[str], model) -> "np.ndarray":
 	"""
 	take a list of strings(chunks), generate an embedding and return it.
@@ -34,3 +45,39 @@ def generate_embeddings(chunks: list[str], model) -> "np.ndarray":
 	logger.info(f"Shape of embeddings: {embeddings.shape}")
 
 	return embeddings
+
+def embed_in_batches(entries: list[dict], model, checkpoint, batch_size: int = 256, shutdown=None) -> "np.ndarray":
+	"""
+	Embed the chunks of entries batch by batch, committing every batch to the checkpoint (an EmbeddingCheckpoint) before the next one.
+	Chunks already in the checkpoint, e.g. from a build that was killed, aren't embedded again.
+	shutdown (from graceful_shutdown) is checked between batches, so a signal stops it with the finished batches saved.
+	Returns the embeddings in the order of entries, like generate_embeddings.
+	"""
+	import numpy as np
+
+	committed_ids, committed_embeddings = checkpoint.load()
+	row_of_id = {int(chunk_id): row for row, chunk_id in enumerate(committed_ids)}
+
+	# identical chunks share an id, they only need one embedding
+	unique_entries = {entry["id"]: entry for entry in entries}
+	todo = [entry for chunk_id, entry in unique_entries.items() if chunk_id not in row_of_id]
+	if len(todo) < len(unique_entries):
+		logger.info(f"Resuming: {len(unique_entries) - len(todo)} chunks were embedded by an earlier run, {len(todo)} to go.")
+
+	all_embeddings = [committed_embeddings]
+	for start in range(0, len(todo), batch_size):
+		if shutdown is not None:
+			shutdown.check()
+
+		batch = todo[start:start + batch_size]
+		ids = np.array([entry["id"] for entry in batch], dtype=np.int64)
+		embeddings = embed_texts([entry["chunk"] for entry in batch], model)
+		checkpoint.commit(ids, embeddings)
+
+		for position, chunk_id in enumerate(ids):
+			row_of_id[int(chunk_id)] = len(committed_ids) + start + position
+		all_embeddings.append(np.asarray(embeddings, dtype=np.float32))
+		logger.info(f"Embedded {min(start + batch_size, len(todo))}/{len(todo)} chunks.")
+
+	all_embeddings = np.concatenate(all_embeddings)
+	return all_embeddings[[row_of_id[entry["id"]] for entry in entries]]
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import time
+import numpy as np
+
+from src.embedding.embedder import embed_texts
+from src.vectorstore.retrieval import retrieve_top_k
+
+logger = logging.getLogger(__name__)
+
+class QueryBatcher:
+	"""
+	Asyncio front end for queries. Concurrent calls to `query` are collected for up to
+	`max_wait_ms` (or until `max_batch_size` requests are waiting), encoded with a single
+	`model.encode` call per embedding model and searched with a single `index.search` per
+	collection on the stacked matrix. Every caller gets back its own (distances, ids) row and
+	the version of the snapshot that was searched, to read the matching metadata. A collection that fails
+	to load or search only fails the callers that asked for it.
+
+	`get_index_and_model` maps a collection name to its (index, embedding model, snapshot version),
+	e.g. `IndexCache.get_index_and_model`, so one batcher serves all collections and collections
+	that use the same model are encoded together.
+
+	usage:
+		batcher = QueryBatcher(index_cache.get_index_and_model)
+		await batcher.start()
+		D, I, version = await batcher.query("protocols tcp icmp", k=10, collection="team_a")
+		await batcher.stop()
+	"""
+
+	def __init__(self, get_index_and_model, max_batch_size: int = 32, max_wait_ms: float = 5.0, default_k: int = 10, default_collection: str = "default"):
+		if max_batch_size < 1:
+			raise ValueError("max_batch_size must be at least 1")
+
+		self.get_index_and_model = get_index_and_model
+		self.default_collection = default_collection
+		self.max_batch_size = max_batch_size
+		self.max_wait = max_wait_ms / 1000
+		self.default_k = default_k
+
+		self._queue = None
+		self._worker = None
+
+	async def start(self) -> None:
+		if self._worker is not None:
+			return
+		self._queue = asyncio.Queue()
+		self._worker = asyncio.create_task(self._run())
+		logger.info(f"Query batcher started (max batch: {self.max_batch_size}, window: {self.max_wait * 1000:.1f} ms)")
+
+	async def stop(self) -> None:
+		"""
+		Stop the worker. Requests still waiting in the queue and the batch being searched are cancelled.
+		"""
+		if self._worker is None:
+			return
+		self._worker.cancel()
+		try:
+			await self._worker
+		except asyncio.CancelledError:
+			pass
+		self._worker = None
+
+		while not self._queue.empty():
+			*_, future = self._queue.get_nowait()
+			if not future.done():
+				future.cancel()
+
+	async def __aenter__(self):
+		await self.start()
+		return self
+
+	async def __aexit__(self, *exc):
+		await self.stop()
+
+	async def query(self, text: str, k: int | None = None, collection: str | None = None):
+		"""
+		Queue a question and wait for its top-k result. Returns (D, I, snapshot version), D and I with
+		shape (1, k) same as `retrieve_top_k` does for a single vector.
+		"""
+		if self._worker is None:
+			raise RuntimeError("QueryBatcher is not started, call start() first")
+
+		future = asyncio.get_running_loop().create_future()
+		await self._queue.put((text, k or self.default_k, collection or self.default_collection, future))
+		return await future
+
+	async def _collect_batch(self) -> list[tuple]:
+		# block until there is at least one request, then keep collecting until the window closes or the batch is full
+		batch = [await self._queue.get()]
+		deadline = time.monotonic() + self.max_wait
+
+		while len(batch) < self.max_batch_size:
+			timeout = deadline - time.monotonic()
+			if timeout <= 0:
+				break
+			try:
+				batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+			except asyncio.TimeoutError:
+				break
+
+		return batch
+
+	async def _run(self) -> None:
+		loop = asyncio.get_running_loop()
+
+		while True:
+			batch = await self._collect_batch()
+
+			# callers that gave up (cancelled) don't need to be encoded
+			batch = [request for request in batch if not request[3].done()]
+			if not batch:
+				continue
+
+			try:
+				# encoding and searching are blocking, run them off the event loop so new requests keep queueing
+				results = await loop.run_in_executor(None, self._search, batch)
+			except asyncio.CancelledError:
+				# stop() during a batch, its callers are off the queue already and would wait forever
+				for *_, future in batch:
+					if not future.done():
+						future.cancel()
+				raise
+			except Exception as e:
+				logger.error(f"Batch of {len(batch)} queries failed: {e}")
+				# drop the traceback, it references this (still running) worker frame and callers must not hold on to it
+				e = e.with_traceback(None)
+				for *_, future in batch:
+					if not future.done():
+						future.set_exception(e)
+				continue
+
+			for (*_, future), result in zip(batch, results):
+				if future.done():
+					continue
+				if isinstance(result, Exception):
+					future.set_exception(result)
+				else:
+					future.set_result(result)
+
+	def _search(self, batch: list[tuple]) -> list:
+		"""
+		Returns one entry per request, its (D, I, version) row or the exception that failed it. A collection that can't
+		be loaded or searched, or a model that can't encode, only fails the requests that needed it.
+		"""
+		results = [None] * len(batch)
+
+		def fail(rows, e, what):
+			logger.error(f"{len(rows)} queries failed, {what}: {e}")
+			# drop the traceback, it references this frame and with it the whole batch
+			e = e.with_traceback(None)
+			for row in rows:
+				results[row] = e
+
+		rows_by_collection = {}
+		for row, (_, _, collection, _) in enumerate(batch):
+			rows_by_collection.setdefault(collection, []).append(row)
+
+		# resolve every collection once, index, model and version come from the same snapshot
+		resolved = {}
+		for collection, rows in rows_by_collection.items():
+			try:
+				resolved[collection] = self.get_index_and_model(collection)
+			except Exception as e:
+				fail(rows, e, f"loading collection '{collection}'")
+
+		# one encode call per model for all the questions that need it, whatever collection they are for
+		rows_by_model = {}
+		for collection, (_, model, _) in resolved.items():
+			rows_by_model.setdefault(id(model), (model, []))[1].extend(rows_by_collection[collection])
+
+		vector_of_row = {}
+		for model, rows in rows_by_model.values():
+			try:
+				vectors = embed_texts([batch[row][0] for row in rows], model)
+			except Exception as e:
+				fail(rows, e, "encoding")
+				continue
+			for position, row in enumerate(rows):
+				vector_of_row[row] = vectors[position]
+
+		for collection, (index, _, version) in resolved.items():
+			rows = [row for row in rows_by_collection[collection] if row in vector_of_row]
+			if not rows:
+				continue
+			k = max(batch[row][1] for row in rows)
+			logger.debug(f"Searching {len(rows)} queries in collection '{collection}' with k={k}")
+			try:
+				D, I = retrieve_top_k(np.stack([vector_of_row[row] for row in rows]), index, k)
+			except Exception as e:
+				fail(rows, e, f"searching collection '{collection}'")
+				continue
+
+			for position, row in enumerate(rows):
+				request_k = batch[row][1]
+				results[row] = (D[position:position + 1, :request_k], I[position:position + 1, :request_k], version)
+
+		return results
@@ -0,0 +1,59 @@
+from pathlib import Path
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "default"
+
+def load_collections(collections_file: Path | None, default_kb_dir: Path | None, default_ignore: list, default_extensions: tuple = (".md",), default_ignore_file: str | None = None) -> dict[str, dict]:
+	"""
+	Return all configured collections (knowledge bases) as a dict of name -> collection dict.
+
+	If `collections_file` exists it is a json object like:
+		{"team_a": {"knowledge_base_dir": "../kb_a", "ignore": [".git", "drafts/", "*.tmp.md"]}, "team_b": {...}}
+	otherwise there is a single "default" collection built from KNOWLEDGE_BASE_DIR/IGNORE_DIRS.
+
+	Each collection dict has: name, knowledge_base_dir (Path), ignore (gitignore style patterns), extensions (tuple)
+	and optionally ignore_file (Path, e.g. the knowledge base's .gitignore), model and backend ("faiss" or "numpy").
+	Its data lives in data/<name>/ (see ensure_data_dir).
+	"ignore_dirs" is still accepted as an alias of "ignore".
+	"""
+	if collections_file and collections_file.exists():
+		raw = json.loads(collections_file.read_text(encoding="utf-8"))
+		logger.debug(f"Loaded {len(raw)} collections from {collections_file}")
+	else:
+		raw = {DEFAULT_COLLECTION: {"knowledge_base_dir": default_kb_dir, "ignore_file": default_ignore_file}}
+
+	collections = {}
+	for name, settings in raw.items():
+		if not name or "/" in name or "\\" in name or ".." in name or name.startswith("."):
+			raise ValueError(f"Invalid collection name: {name!r}")
+		if not settings.get("knowledge_base_dir"):
+			raise ValueError(f"Collection {name!r} has no knowledge_base_dir")
+
+		collections[name] = {
+			**settings,
+			"name": name,
+			"knowledge_base_dir": Path(settings["knowledge_base_dir"]),
+			"ignore": list(settings.get("ignore", settings.get("ignore_dirs", default_ignore))),
+			"extensions": tuple(settings.get("extensions", default_extensions)),
+		}
+
+		if settings.get("ignore_file"):
+			collections[name]["ignore_file"] = collections[name]["knowledge_base_dir"] / settings["ignore_file"]
+
+	return collections
+
+def get_collection(collections: dict[str, dict], name: str) -> dict:
+	if name not in collections:
+		raise KeyError(f"Unknown collection {name!r}, configured: {', '.join(sorted(collections))}")
+	return collections[name]
+
+def configured_collection(name: str) -> dict:
+	"""
+	get_collection from COLLECTIONS_FILE, or the single "default" collection configured in .env.
+	Every entry point resolves --collection through this before touching data/<name>/.
+	"""
+	from config import COLLECTIONS_FILE, KNOWLEDGE_BASE_DIR, IGNORE_DIRS, KNOWLEDGE_EXTENSIONS, IGNORE_FILE
+	return get_collection(load_collections(COLLECTIONS_FILE, KNOWLEDGE_BASE_DIR, IGNORE_DIRS, KNOWLEDGE_EXTENSIONS, IGNORE_FILE), name)
@@ -25,6 +25,10 @@ def hash_file(md_file: Path) -> str:
 
 	return h.hexdigest()
 
+# partitioned builds split the files by a hash of their path, so every job (on any machine) agrees on which files are its own.
+def partition_of(md_relative_path: str, partitions: int) -> int:
+	return int(hash_text(md_relative_path), 16) % partitions
+
 # for a markdown file receive the path, it's current hash and the metadata dict. compare current hash with the old one(if exists) and if hash has changed or it is a new file update the dict and return True
 def needs_processing(md_relative_path: str, current_md_hash: str, metadata: dict) -> bool:
 	if md_relative_path in metadata:
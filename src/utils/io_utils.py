@@ -4,10 +4,17 @@ import json
 
 logger = logging.getLogger(__name__)
 
-# create data dir
-def ensure_data_dir() -> Path:
-	data_dir = Path("data/")
-	data_dir.mkdir(exist_ok=True)
+# path of a collection's data dir (data/<collection>/), without creating it. each collection has its own metadata and index.
+def data_dir_path(collection: str = "default") -> Path:
+	# the name becomes a directory name, it must not point anywhere outside data/
+	if not collection or "/" in collection or "\\" in collection or ".." in collection or collection.startswith("."):
+		raise ValueError(f"Invalid collection name: {collection!r}")
+	return Path("data") / collection
+
+# create the data dir of a collection
+def ensure_data_dir(collection: str = "default") -> Path:
+	data_dir = data_dir_path(collection)
+	data_dir.mkdir(parents=True, exist_ok=True)
 	return data_dir
 
 # this is where we store the hashes of files, in order to not run the pipeline on those files for which the content hasn't changed.
@@ -51,7 +58,7 @@ def save_dict_to_json(metadata_file: Path, metadata: dict) -> None:
 	try:
 		with metadata_file.open("w", encoding="utf-8") as f:
 			json.dump(metadata, f, indent=2)
-			logger.info(f"Wrote dict with hashes to metadata.json")
+			logger.info(f"Wrote dict to {metadata_file.name}")
 	except (OSError, json.JSONDecodeError) as e:
 		logger.error(f"Error saving metadata to {metadata_file}: {e}")
 
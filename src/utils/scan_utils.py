@@ -1,20 +1,150 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
+from typing import Iterator, NamedTuple
 import os
+import re
 
 logger = logging.getLogger(__name__)
 
+class ScannedFile(NamedTuple):
+	# plain strings, no Path objects are built while scanning
+	path: str
+	relative_path: str
+	size: int
+	mtime_ns: int
+
+def _glob_to_regex(pattern: str) -> str:
+	"""
+	Translate a gitignore glob to a regex matching a relative posix path: * and ? don't cross "/", ** does.
+	"""
+	regex = ""
+	i = 0
+	while i < len(pattern):
+		if pattern.startswith("**/", i):
+			regex += "(?:.*/)?"
+			i += 3
+		elif pattern.startswith("/**", i) and i + 3 == len(pattern):
+			regex += "/.*"
+			i += 3
+		elif pattern.startswith("**", i):
+			regex += ".*"
+			i += 2
+		elif pattern[i] == "*":
+			regex += "[^/]*"
+			i += 1
+		elif pattern[i] == "?":
+			regex += "[^/]"
+			i += 1
+		elif pattern[i] == "[" and "]" in pattern[i + 1:]:
+			end = pattern.index("]", i + 1)
+			char_class = pattern[i + 1:end]
+			if char_class.startswith("!"):
+				char_class = "^" + char_class[1:]
+			regex += "[" + char_class + "]"
+			i = end + 1
+		else:
+			regex += re.escape(pattern[i])
+			i += 1
+	return regex
+
+class IgnoreMatcher:
+	"""
+	Matches relative paths against .gitignore style patterns:
+	- `name` or `*.tmp` match a file or directory with that name at any depth
+	- `docs/drafts` or `/build` (a slash anywhere but the end) are anchored at the knowledge base root
+	- a trailing `/` only matches directories, `**` matches any number of directories
+	- `!pattern` re-includes what an earlier pattern excluded, the last matching pattern wins
+	- blank lines and lines starting with `#` are ignored
+	An excluded directory isn't descended into, so nothing below it can be re-included (same as git).
+	"""
+
+	def __init__(self, patterns):
+		self.rules = []
+		for pattern in patterns:
+			pattern = pattern.strip()
+			if not pattern or pattern.startswith("#"):
+				continue
+
+			negate = pattern.startswith("!")
+			pattern = pattern.removeprefix("!")
+			dir_only = pattern.endswith("/")
+			pattern = pattern.rstrip("/")
+			anchored = "/" in pattern
+			pattern = pattern.lstrip("/")
+
+			regex = _glob_to_regex(pattern)
+			if not anchored:
+				regex = "(?:.*/)?" + regex
+			self.rules.append((re.compile(regex + r"\Z"), negate, dir_only))
+
+	@classmethod
+	def from_sources(cls, patterns=(), ignore_file: Path | None = None) -> "IgnoreMatcher":
+		patterns = list(patterns)
+		if ignore_file is not None and ignore_file.exists():
+			patterns += ignore_file.read_text(encoding="utf-8").splitlines()
+		return cls(patterns)
+
+	def ignored(self, relative_path: str, is_dir: bool) -> bool:
+		ignored = False
+		for regex, negate, dir_only in self.rules:
+			if dir_only and not is_dir:
+				continue
+			if regex.match(relative_path):
+				ignored = not negate
+		return ignored
+
+def _scan_dir(directory: str, relative_dir: str, matcher: IgnoreMatcher, extensions: tuple) -> tuple[list, list]:
+	"""
+	One level of the walk: returns the matching files and the sub directories still to scan.
+	"""
+	files, subdirs = [], []
+	try:
+		with os.scandir(directory) as entries:
+			for entry in entries:
+				relative_path = f"{relative_dir}{entry.name}"
+				try:
+					# like os.walk, don't follow symlinked directories
+					is_dir = entry.is_dir(follow_symlinks=False)
+					if matcher.ignored(relative_path, is_dir):
+						continue
+					if is_dir:
+						subdirs.append((entry.path, relative_path + "/"))
+					elif entry.name.endswith(extensions):
+						stat = entry.stat()
+						files.append(ScannedFile(entry.path, relative_path, stat.st_size, stat.st_mtime_ns))
+				except OSError as e:
+					logger.warning(f"Skipping {entry.path}: {e}")
+	except OSError as e:
+		logger.warning(f"Can't scan {directory}: {e}")
+
+	return files, subdirs
+
+def scan_knowledge_files(base_dir: Path, ignore_patterns=(), extensions=(".md",), workers: int = 8, ignore_file: Path | None = None) -> Iterator[ScannedFile]:
+	"""
+	Walk base_dir with os.scandir, several directories at a time, and yield every file with one of the extensions
+	as soon as its directory is scanned. Order is not deterministic. Files come with their size and mtime so later
+	stages don't have to stat them again.
+	"""
+	matcher = IgnoreMatcher.from_sources(ignore_patterns, ignore_file)
+	extensions = tuple(extensions)
+	count = 0
+
+	# directories are independent, on network filesystems most of the time goes into waiting for scandir/stat
+	with ThreadPoolExecutor(max_workers=workers) as pool:
+		pending = {pool.submit(_scan_dir, str(base_dir), "", matcher, extensions)}
+		while pending:
+			done, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in done:
+				files, subdirs = future.result()
+				for directory, relative_dir in subdirs:
+					pending.add(pool.submit(_scan_dir, directory, relative_dir, matcher, extensions))
+				count += len(files)
+				yield from files
+
+	logger.info(f"Scanned {count} knowledge files.")
+
 # retrieve all the md filenames while ignoring irrelevant directories
 def retrieve_md_filenames(base_dir: Path, ignore_dirs: set) -> list[Path]:
 	logger.info(f"Ignoring directories: {ignore_dirs}")
-	md_files = []
-
-	for root, dirs, files in os.walk(base_dir):
-		# remove ignored dirs from traversal
-		dirs[:] = [d for d in dirs if d not in ignore_dirs]
-		for file in files:
-			if file.endswith(".md"):
-				md_files.append(Path(root) / file)
-
-	logger.info(f"Scanned {len(md_files)} knowledge files.")
-	return md_files
+	return sorted(Path(f.path) for f in scan_knowledge_files(base_dir, ignore_dirs))
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+import logging
+import os
+import signal
+import threading
+
+logger = logging.getLogger(__name__)
+
+# in worker processes: (shared value the parent sets to the signal number it received, parent pid), see stop_when_parent_stops
+_parent = None
+
+class ShutdownRequested(Exception):
+	"""
+	Raised at a safe point (after the current batch is committed) once SIGINT or SIGTERM was received.
+	"""
+
+	def __init__(self, signum: int):
+		super().__init__(signum)
+		self.signum = signum
+
+	def __str__(self):
+		return f"Stopped by {signal.Signals(self.signum).name}"
+
+class GracefulShutdown:
+	def __init__(self):
+		self.requested = False
+		self.signum = None
+
+	def check(self) -> None:
+		"""
+		Call between batches, raises ShutdownRequested if a signal came in (here or in the parent process)
+		or the parent process is gone.
+		"""
+		if not self.requested and _parent is not None:
+			stop_signal, parent_pid = _parent
+			if stop_signal.value:
+				self.requested = True
+				self.signum = stop_signal.value
+			elif os.getppid() != parent_pid:
+				logger.warning("The parent process is gone, stopping after the current batch.")
+				self.requested = True
+				self.signum = signal.SIGHUP
+		if self.requested:
+			raise ShutdownRequested(self.signum)
+
+def stop_when_parent_stops(stop_signal, parent_pid: int) -> None:
+	"""
+	Call first thing in a worker process. stop_signal is a multiprocessing.Value("i") the parent sets when it gets
+	SIGINT/SIGTERM, every graceful_shutdown in this process then stops at its next check() as if it got the signal itself.
+	It also stops when parent_pid is no longer its parent (the parent was killed), instead of working on as an orphan.
+	"""
+	global _parent
+	_parent = (stop_signal, parent_pid)
+
+@contextmanager
+def graceful_shutdown(signals=(signal.SIGINT, signal.SIGTERM), on_signal=None):
+	"""
+	While active, the first SIGINT/SIGTERM only sets `requested` so the work can stop at the next `check()`.
+	A second signal interrupts right away. Outside the main thread signals can't be caught and nothing changes.
+	on_signal(signum) is called for every signal received, e.g. to pass it on to worker processes.
+
+	usage:
+		with graceful_shutdown() as shutdown:
+			for batch in batches:
+				shutdown.check()
+				...
+	"""
+	shutdown = GracefulShutdown()
+
+	def handle(signum, frame):
+		if on_signal is not None:
+			on_signal(signum)
+		if shutdown.requested:
+			raise KeyboardInterrupt
+		shutdown.requested = True
+		shutdown.signum = signum
+		logger.warning(f"Received {signal.Signals(signum).name}, stopping after the current batch. Send it again to stop right away.")
+
+	if threading.current_thread() is not threading.main_thread():
+		yield shutdown
+		return
+
+	previous = {signum: signal.signal(signum, handle) for signum in signals}
+	try:
+		yield shutdown
+	finally:
+		for signum, handler in previous.items():
+			signal.signal(signum, handler)
@@ -0,0 +1,187 @@
+from contextlib import contextmanager
+from pathlib import Path
+import logging
+import json
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+# layout of a collection's data dir:
+#   data/<collection>/CURRENT                  name of the published snapshot
+#   data/<collection>/snapshots/<version>/     immutable: manifest.json, metadata.json, metadata_store.jsonl, index
+#   data/<collection>/snapshots/.staging-<version>/   a build in progress
+#   data/<collection>/build.lock
+# readers only ever follow CURRENT, so they see either the old or the new snapshot, never a partial build.
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_DIR = "snapshots"
+STAGING_PREFIX = ".staging-"
+# the data dir layout before snapshots, see import_legacy_data
+LEGACY_FILES = ("index.faiss", "metadata.json", "metadata_store.jsonl")
+
+def current_snapshot_version(data_dir: Path) -> str | None:
+	try:
+		version = (data_dir / CURRENT_FILE).read_text(encoding="utf-8").strip()
+	except FileNotFoundError:
+		return None
+	return version or None
+
+def snapshot_dir(data_dir: Path, version: str) -> Path:
+	return data_dir / SNAPSHOTS_DIR / version
+
+def current_snapshot_dir(data_dir: Path) -> Path | None:
+	"""
+	Return the directory of the published snapshot, or None if nothing was published yet.
+	"""
+	version = current_snapshot_version(data_dir)
+	if version is None:
+		return None
+
+	current_dir = snapshot_dir(data_dir, version)
+	if not current_dir.is_dir():
+		logger.error(f"CURRENT points to missing snapshot {current_dir}")
+		return None
+	return current_dir
+
+def read_manifest(snapshot_dir: Path | None) -> dict:
+	"""
+	manifest.json records what the snapshot's index was built with: {"model": ..., "dim": ..., "backend": ...}.
+	Returns {} if there is no snapshot or it predates manifests.
+	"""
+	if snapshot_dir is None or not (snapshot_dir / "manifest.json").exists():
+		return {}
+	return json.loads((snapshot_dir / "manifest.json").read_text(encoding="utf-8"))
+
+def write_manifest(snapshot_dir: Path, model_name: str, dim: int, backend: str = "faiss", **extra) -> None:
+	# extra keys are only used by partials (run id, base snapshot), see partition.py
+	manifest = {"model": model_name, "dim": dim, "backend": backend, **extra}
+	(snapshot_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+def create_staging_dir(data_dir: Path) -> Path:
+	"""
+	Create an empty directory for a new snapshot. Nothing reads it until publish_snapshot renames it.
+	"""
+	# time based so versions sort in build order
+	version = f"{time.time_ns():020d}"
+	staging_dir = data_dir / SNAPSHOTS_DIR / f"{STAGING_PREFIX}{version}"
+	staging_dir.mkdir(parents=True)
+	logger.debug(f"Created staging dir {staging_dir}")
+	return staging_dir
+
+def _fsync_dir(directory: Path) -> None:
+	# make sure the files and the directory entries themselves are on disk before the pointer moves
+	for path in directory.iterdir():
+		if path.is_file():
+			with path.open("rb") as f:
+				os.fsync(f.fileno())
+
+	fd = os.open(directory, os.O_RDONLY)
+	try:
+		os.fsync(fd)
+	finally:
+		os.close(fd)
+
+def publish_snapshot(data_dir: Path, staging_dir: Path) -> Path:
+	"""
+	Turn a finished staging dir into a snapshot and atomically point CURRENT at it.
+	"""
+	version = staging_dir.name.removeprefix(STAGING_PREFIX)
+	published_dir = staging_dir.with_name(version)
+
+	_fsync_dir(staging_dir)
+	staging_dir.rename(published_dir)
+
+	# write the new pointer next to the old one then swap, os.replace is atomic on posix and windows
+	tmp_pointer = data_dir / f"{CURRENT_FILE}.tmp"
+	with tmp_pointer.open("w", encoding="utf-8") as f:
+		f.write(version)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp_pointer, data_dir / CURRENT_FILE)
+	_fsync_dir(data_dir)
+
+	logger.info(f"Published snapshot {version}")
+	return published_dir
+
+def import_legacy_data(data_dir: Path, legacy_dirs: list[Path]) -> Path | None:
+	"""
+	Before snapshots, index.faiss, metadata.json and metadata_store.jsonl lived directly in data/ (single knowledge base)
+	or in data/<collection>/. If the collection has no snapshot yet, the first of legacy_dirs holding those files becomes
+	its first snapshot, so upgrading doesn't re-embed everything. Only call this while holding the build lock.
+	"""
+	if current_snapshot_version(data_dir) is not None:
+		return None
+
+	for legacy_dir in legacy_dirs:
+		if not all((legacy_dir / name).is_file() for name in LEGACY_FILES):
+			continue
+
+		# copy, the originals are only removed once the snapshot is published
+		staging_dir = create_staging_dir(data_dir)
+		for name in LEGACY_FILES:
+			shutil.copy2(legacy_dir / name, staging_dir / name)
+		published_dir = publish_snapshot(data_dir, staging_dir)
+
+		for name in LEGACY_FILES:
+			(legacy_dir / name).unlink()
+		logger.info(f"Imported the index and metadata in {legacy_dir} as snapshot {published_dir.name}")
+		return published_dir
+
+	return None
+
+def discard_staging_dir(staging_dir: Path) -> None:
+	shutil.rmtree(staging_dir, ignore_errors=True)
+	logger.info(f"Discarded unfinished snapshot {staging_dir.name}")
+
+def gc_snapshots(data_dir: Path, keep: int = 2) -> list[str]:
+	"""
+	Delete all but the `keep` newest snapshots (the published one is always kept) and leftover staging
+	dirs of crashed builds. Only call this while holding the build lock.
+	Readers that already loaded an older snapshot keep it in memory, so deleting its files is safe.
+	"""
+	snapshots_dir = data_dir / SNAPSHOTS_DIR
+	if not snapshots_dir.is_dir():
+		return []
+
+	current = current_snapshot_version(data_dir)
+	versions = sorted((p.name for p in snapshots_dir.iterdir() if p.is_dir() and not p.name.startswith(STAGING_PREFIX)), reverse=True)
+	keep_versions = set(versions[:max(keep, 1)]) | {current}
+
+	removed = []
+	for path in snapshots_dir.iterdir():
+		if not path.is_dir():
+			continue
+		if path.name.startswith(STAGING_PREFIX) or path.name not in keep_versions:
+			shutil.rmtree(path, ignore_errors=True)
+			removed.append(path.name)
+
+	if removed:
+		logger.info(f"Garbage collected {len(removed)} old snapshots")
+	return removed
+
+@contextmanager
+def build_lock(data_dir: Path, timeout: float | None = 0):
+	"""
+	Only one build per collection at a time. Queries never take this lock.
+	By default a second build fails right away, timeout waits up to that many seconds for it (None waits as long as it takes).
+	"""
+	import fcntl
+
+	lock_file = (data_dir / "build.lock").open("w")
+	try:
+		deadline = None if timeout is None else time.monotonic() + timeout
+		while True:
+			try:
+				fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+				break
+			except BlockingIOError:
+				if deadline is not None and time.monotonic() >= deadline:
+					raise RuntimeError(f"Another build is already running for {data_dir}")
+				if timeout != 0:
+					logger.debug(f"Waiting for the build lock of {data_dir}")
+				time.sleep(0.5)
+		yield
+	finally:
+		lock_file.close()
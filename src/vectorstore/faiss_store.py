@@ -1,13 +1,19 @@
 from pathlib import Path
-import faiss, os, numpy as np
+import os
 import logging
 
 logger = logging.getLogger(__name__)
 
+# the FAISS backend. faiss is imported lazily, collections using the numpy backend never import it.
+
+INDEX_FILE = "index.faiss"
+
 def persist_faiss_index(index, faiss_index_path: Path) -> None:
 	"""
 	Write the FAISS index to disk with logging.
 	"""
+	import faiss
+
 	faiss.write_index(index, str(faiss_index_path))
 	logger.info(f"Wrote FAISS index to {faiss_index_path}")
 
@@ -23,6 +29,8 @@ def load_or_create_faiss_index(faiss_index_path: Path, dim: int):
 		Returns:
 			faiss.Index: The loaded or newly created FAISS index.
 	"""
+	import faiss
+
 	if os.path.exists(faiss_index_path):
 		index = faiss.read_index(str(faiss_index_path))
 		logger.info(f"Index already exists, loading {faiss_index_path}")
@@ -39,56 +47,26 @@ def load_or_create_faiss_index(faiss_index_path: Path, dim: int):
 
 # we are gonna use IndexIDMap. this is so that we can remove stale chunks. https://github.com/facebookresearch/faiss/wiki/Pre--and-post-processing
 
-def add_to_index(ids: "np.ndarray", embeddings: "np.ndarray", index, faiss_index_path: Path) -> None:
+def faiss_index_contents(index) -> tuple["np.ndarray", "np.ndarray"]:
 	"""
-	Stores embeddings in a FAISS index and writes corresponding metadata entries to a JSONL file.
-
-	Args:
-		chunks: list of text chunks
-		embeddings: numpy array of shape (N, dim)
-		metadata_path: path to metadata JSONL file
-		faiss_path: path to FAISS index file
-		source: optional string for source info (e.g., filename)
+	Return (ids, vectors) of an IndexIDMap2 over a flat index, e.g. to move it to another backend.
 	"""
-
 	import faiss
-	import numpy as np
 
-	# we read the existing index if it exists to add to it. Currently the implementation is not so clear to me, but assuming we will be adding embeddings say because we have a new file or a file has changed, we want to read the current index into memory and add embeddings to it. i am not sure how deleting old parts would work. We create an indexidmap index to be able to assign ids to each index instead of arbitrary ids.
-	
-	# --- add to index ---
-	logger.info(f"Current index size before adding: {index.ntotal}")
-	num_to_add = ids.size
-	
-	index.add_with_ids(embeddings, ids)
-	logger.info(f"Stored {num_to_add} embeddings to the index.")
-	logger.info(f"Index size after adding: {index.ntotal}")
-	
-	persist_faiss_index(index, str(faiss_index_path))
-
-def remove_from_faiss_index(ids: "np.array", index, faiss_index_path: Path) -> None:
-	"""
-		Delete embeddings from a FAISS index by their IDs and persist the updated index.
-
-		Args:
-			ids (np.ndarray): Array of integer IDs to remove from the index.
-			index (faiss.Index): The FAISS index to update.
-			faiss_index_path (str | Path): Path where the FAISS index is stored.
+	ids = faiss.vector_to_array(index.id_map).astype("int64")
+	vectors = index.index.reconstruct_n(0, index.ntotal)
+	return ids, vectors
 
-		Returns:
-			None
+def faiss_index_vectors(index, ids: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+	"""
+	Return (ids, vectors) of those of the given ids that are in an IndexIDMap2, one reconstruct per id.
 	"""
 	import faiss
 	import numpy as np
 
-	if index is None or ids.size == 0:
-		logger.info("No embeddings to delete.")
-		return
-
-	num_to_delete = ids.size
-	index.remove_ids(ids)
-	
-	logger.info(f"Deleted {num_to_delete} embeddings from the FAISS index.")
-	logger.info(f"Index size after deletion: {index.ntotal}")
-
-	persist_faiss_index(index, str(faiss_index_path))
+	index_ids = faiss.vector_to_array(index.id_map).astype("int64")
+	found = index_ids[np.isin(index_ids, ids)]
+	vectors = np.empty((found.size, index.d), dtype=np.float32)
+	for row, chunk_id in enumerate(found):
+		vectors[row] = index.reconstruct(int(chunk_id))
+	return found, vectors
@@ -0,0 +1,152 @@
+from collections import OrderedDict
+import logging
+import threading
+
+from src.utils.io_utils import data_dir_path
+from src.utils.snapshot_utils import current_snapshot_version, current_snapshot_dir, read_manifest
+from src.vectorstore.store import load_index
+
+logger = logging.getLogger(__name__)
+
+def estimate_index_bytes(index) -> int:
+	"""
+	Rough in-memory size of a flat index with ids: one float32 vector plus one int64 id per entry.
+	"""
+	return index.ntotal * (index.d * 4 + 8)
+
+class IndexCache:
+	"""
+	Holds the indexes of several collections in one process. An index is loaded the first time its
+	collection is queried, and the least recently used indexes are evicted once the loaded ones
+	together exceed `memory_budget_mb`. The index that was just requested is never evicted, so a
+	single index bigger than the budget is still served.
+
+	When a build publishes a new snapshot the new index is loaded in a background thread, queries
+	keep getting the previous one until it is ready.
+
+	Embedding models are shared: every collection whose manifest names the same model uses one
+	loaded copy. `default_model` is used for snapshots without a manifest.
+	"""
+
+	def __init__(self, memory_budget_mb: float, default_model: str | None = None):
+		self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+		self.default_model = default_model
+
+		# name -> (index, estimated bytes, snapshot version, model name), ordered from least to most recently used
+		self._indexes = OrderedDict()
+		self._models = {}
+		self._reloading = set()
+		self._lock = threading.Lock()
+
+	def __contains__(self, name: str) -> bool:
+		return name in self._indexes
+
+	@property
+	def used_bytes(self) -> int:
+		return sum(entry[1] for entry in self._indexes.values())
+
+	def get(self, name: str):
+		return self._entry(name)[0]
+
+	def get_index_and_model(self, name: str) -> tuple:
+		"""
+		Return (index, embedding model, snapshot version) of the same snapshot, questions must be embedded with the model the index was built with.
+		"""
+		index, _, version, model_name = self._entry(name)
+		return index, self._model(model_name), version
+
+	def evict(self, name: str) -> None:
+		with self._lock:
+			self._indexes.pop(name, None)
+			self._drop_unused_models()
+
+	def _entry(self, name: str) -> tuple:
+		latest = self._latest_version(name)
+
+		# queries are searched from executor threads, so loading and eviction need a lock
+		with self._lock:
+			if name in self._indexes:
+				self._indexes.move_to_end(name)
+				entry = self._indexes[name]
+				if entry[2] != latest and name not in self._reloading:
+					self._reloading.add(name)
+					threading.Thread(target=self._reload, args=(name,), daemon=True).start()
+				return entry
+
+			self._store(name, *self._load(name))
+			return self._indexes[name]
+
+	def _model(self, model_name: str):
+		with self._lock:
+			model = self._models.get(model_name)
+		if model is not None:
+			return model
+
+		# loading a model takes seconds, never do it while holding the lock or every collection's queries wait for it.
+		# lazy import, sentence_transformers is slow to import
+		from src.embedding.embedder import create_embedding_model
+		model = create_embedding_model(model_name)
+		with self._lock:
+			# another thread may have loaded it meanwhile, keep one copy
+			return self._models.setdefault(model_name, model)
+
+	def _latest_version(self, name: str) -> str | None:
+		return current_snapshot_version(data_dir_path(name))
+
+	def _load(self, name: str) -> tuple:
+		"""
+		Load the index of the currently published snapshot, returns (index, snapshot version, model name).
+		"""
+		snapshot_dir = current_snapshot_dir(data_dir_path(name))
+		if snapshot_dir is None:
+			raise FileNotFoundError(f"No published snapshot for collection '{name}', run a build first")
+
+		manifest = read_manifest(snapshot_dir)
+		index = load_index(snapshot_dir, manifest.get("backend", "faiss"))
+		return index, snapshot_dir.name, manifest.get("model") or self.default_model
+
+	def _reload(self, name: str) -> None:
+		# runs without the lock, so queries are served from the old index (and model) while the new ones load.
+		# after a migration the new snapshot names another model, it is loaded here before the snapshot is swapped in
+		with self._lock:
+			old = self._indexes.get(name)
+			# only collections queried through get_index_and_model need a model
+			needs_model = old is not None and old[3] in self._models
+
+		try:
+			loaded = self._load(name)
+			model = self._model(loaded[2]) if needs_model else None
+		except Exception as e:
+			logger.error(f"Reloading index of collection '{name}' failed, keeping the old one: {e}")
+			loaded = None
+
+		with self._lock:
+			self._reloading.discard(name)
+			if loaded is not None:
+				if model is not None:
+					# _drop_unused_models may have unloaded it while no entry used it yet
+					self._models.setdefault(loaded[2], model)
+				self._store(name, *loaded)
+
+	def _store(self, name: str, index, version: str | None, model_name: str | None) -> None:
+		self._indexes[name] = (index, estimate_index_bytes(index), version, model_name)
+		self._indexes.move_to_end(name)
+		logger.info(f"Loaded index of collection '{name}' snapshot {version} ({index.ntotal} vectors, {model_name})")
+		self._evict(keep=name)
+		self._drop_unused_models()
+
+	def _evict(self, keep: str) -> None:
+		while self.used_bytes > self.memory_budget and len(self._indexes) > 1:
+			name = next(iter(self._indexes))
+			if name == keep:
+				break
+			size = self._indexes.pop(name)[1]
+			logger.info(f"Evicted index of collection '{name}' (~{size / 1024 / 1024:.1f} MB) to stay under the memory budget")
+
+	def _drop_unused_models(self) -> None:
+		# e.g. after a migration cut over, the old model is no longer needed
+		in_use = {entry[3] for entry in self._indexes.values()}
+		for model_name in list(self._models):
+			if model_name not in in_use:
+				del self._models[model_name]
+				logger.info(f"Unloaded embedding model {model_name}")
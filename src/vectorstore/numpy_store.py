@@ -0,0 +1,121 @@
+from pathlib import Path
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# exact search without faiss for small knowledge bases (a few thousand chunks), where importing faiss and reading
+# the index costs more than the search itself. vectors live in index.npy (memory-mapped when loaded), ids in index.ids.npy.
+
+INDEX_FILE = "index.npy"
+IDS_FILE = "index.ids.npy"
+
+# rows of the index multiplied with the queries at once, bounds the size of the distance matrix
+SEARCH_BLOCK_ROWS = 65536
+
+class NumpyIndex:
+	"""
+	Flat L2 index with ids, same interface as the faiss IndexIDMap2 we use: d, ntotal, add_with_ids, remove_ids,
+	search (squared L2 distances, -1 ids when there are fewer than k vectors) and reconstruct.
+	"""
+
+	def __init__(self, vectors: np.ndarray, ids: np.ndarray):
+		self.vectors = vectors
+		self.ids = ids
+		self.d = vectors.shape[1]
+		self._norms = None
+		self._rows = None
+
+	@property
+	def ntotal(self) -> int:
+		return self.ids.size
+
+	def _changed(self) -> None:
+		self._norms = None
+		self._rows = None
+
+	def add_with_ids(self, embeddings: np.ndarray, ids: np.ndarray) -> None:
+		embeddings = np.asarray(embeddings, dtype=np.float32)
+		if embeddings.shape[1] != self.d:
+			raise ValueError(f"Expected vectors of dimension {self.d}, got {embeddings.shape[1]}")
+		# this copies a memory-mapped index into memory, only builds add vectors
+		self.vectors = np.concatenate([self.vectors, embeddings])
+		self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+		self._changed()
+
+	def remove_ids(self, ids: np.ndarray) -> int:
+		keep = ~np.isin(self.ids, ids)
+		removed = int(self.ids.size - keep.sum())
+		self.vectors = self.vectors[keep]
+		self.ids = self.ids[keep]
+		self._changed()
+		return removed
+
+	def reconstruct(self, chunk_id: int) -> np.ndarray:
+		if self._rows is None:
+			self._rows = {int(i): row for row, i in enumerate(self.ids)}
+		return np.array(self.vectors[self._rows[int(chunk_id)]])
+
+	def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+		queries = np.asarray(queries, dtype=np.float32)
+		n = queries.shape[0]
+
+		if self._norms is None:
+			self._norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+		query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+
+		# best k of every block, then the best k of those
+		best_distances = np.empty((n, 0), dtype=np.float32)
+		best_rows = np.empty((n, 0), dtype=np.int64)
+		for start in range(0, self.ntotal, SEARCH_BLOCK_ROWS):
+			block = self.vectors[start:start + SEARCH_BLOCK_ROWS]
+			# ||q - x||^2 = ||q||^2 - 2 q.x + ||x||^2, one matrix product for all the queries
+			distances = query_norms - 2 * queries @ block.T + self._norms[start:start + SEARCH_BLOCK_ROWS][None, :]
+
+			if distances.shape[1] > k:
+				top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+				distances = np.take_along_axis(distances, top, axis=1)
+			else:
+				top = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+
+			best_distances = np.concatenate([best_distances, distances], axis=1)
+			best_rows = np.concatenate([best_rows, top + start], axis=1)
+
+			if best_distances.shape[1] > k:
+				top = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+				best_distances = np.take_along_axis(best_distances, top, axis=1)
+				best_rows = np.take_along_axis(best_rows, top, axis=1)
+
+		order = np.argsort(best_distances, axis=1)
+		best_distances = np.maximum(np.take_along_axis(best_distances, order, axis=1), 0)
+		best_rows = np.take_along_axis(best_rows, order, axis=1)
+
+		# like faiss: pad with -1 ids and max float distances when there are fewer than k vectors
+		D = np.full((n, k), np.finfo(np.float32).max, dtype=np.float32)
+		I = np.full((n, k), -1, dtype=np.int64)
+		found = best_rows.shape[1]
+		D[:, :found] = best_distances
+		I[:, :found] = self.ids[best_rows]
+		return D, I
+
+def persist_numpy_index(index: NumpyIndex, directory: Path) -> None:
+	"""
+	Write vectors and ids, each through a temp file and a rename.
+	"""
+	for name, array in ((INDEX_FILE, index.vectors), (IDS_FILE, index.ids)):
+		tmp_file = directory / f"{name}.tmp"
+		with tmp_file.open("wb") as f:
+			np.save(f, np.ascontiguousarray(array))
+		os.replace(tmp_file, directory / name)
+	logger.info(f"Wrote numpy index to {directory / INDEX_FILE}")
+
+def load_or_create_numpy_index(directory: Path, dim: int) -> NumpyIndex:
+	if (directory / INDEX_FILE).exists():
+		index = NumpyIndex(np.load(directory / INDEX_FILE, mmap_mode="r"), np.load(directory / IDS_FILE))
+		logger.info(f"Index already exists, loading {directory / INDEX_FILE}")
+	else:
+		index = NumpyIndex(np.empty((0, dim), dtype=np.float32), np.empty(0, dtype=np.int64))
+		logger.info(f"Creating a new numpy index in {directory} with dimension: {dim}")
+		persist_numpy_index(index, directory)
+	return index
@@ -1,13 +1,12 @@
-import faiss
 from config import logging
 # we want to pass a vector and find top-k vectors in the index matching this vector.
 
 def retrieve_top_k(vector: "np.ndarray", index, k: int):
 	"""
-	Return top-k nearest neighbours to vector in index.
+	Return top-k nearest neighbours to vector in index. Works for every backend, vector can be a (n, dim) matrix of queries.
 	"""
-	logging.info(f"Vector shape is: {vector.shape}")
+	logging.debug(f"Vector shape is: {vector.shape}")
 	D, I = index.search(vector, k)
-	print(I)
-	print(D)
+	logging.debug(f"Ids: {I}")
+	logging.debug(f"Distances: {D}")
 	return D, I
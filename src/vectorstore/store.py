@@ -0,0 +1,130 @@
+from pathlib import Path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# backend independent access to a snapshot's index. every backend's index has the interface of the faiss
+# IndexIDMap2 we started with (d, ntotal, add_with_ids, remove_ids, search, reconstruct), so only loading,
+# persisting and exporting differ. backends are imported lazily, a numpy collection never imports faiss.
+
+BACKENDS = ("faiss", "numpy")
+
+def _backend_module(backend: str):
+	if backend == "faiss":
+		from src.vectorstore import faiss_store
+		return faiss_store
+	if backend == "numpy":
+		from src.vectorstore import numpy_store
+		return numpy_store
+	raise ValueError(f"Unknown vector store backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+def backend_of(index) -> str:
+	from src.vectorstore.numpy_store import NumpyIndex
+	return "numpy" if isinstance(index, NumpyIndex) else "faiss"
+
+def index_exists(directory: Path, backend: str) -> bool:
+	return (directory / _backend_module(backend).INDEX_FILE).exists()
+
+def load_or_create_index(directory: Path, dim: int, backend: str = "faiss"):
+	"""
+	Load the index stored in directory (a snapshot dir) or create an empty one with the given dimension and save it.
+	"""
+	module = _backend_module(backend)
+	if backend == "numpy":
+		return module.load_or_create_numpy_index(directory, dim)
+	return module.load_or_create_faiss_index(directory / module.INDEX_FILE, dim)
+
+def load_index(directory: Path, backend: str = "faiss"):
+	"""
+	Load the index of a published snapshot (or a partial). Unlike load_or_create_index this never writes, snapshots are immutable.
+	"""
+	if not index_exists(directory, backend):
+		raise FileNotFoundError(f"{directory} has no {backend} index")
+	return load_or_create_index(directory, None, backend)
+
+def persist_index(index, directory: Path) -> None:
+	backend = backend_of(index)
+	module = _backend_module(backend)
+	if backend == "numpy":
+		module.persist_numpy_index(index, directory)
+	else:
+		module.persist_faiss_index(index, directory / module.INDEX_FILE)
+
+def index_contents(index) -> tuple["np.ndarray", "np.ndarray"]:
+	"""
+	Return (ids, vectors) of every entry in the index.
+	"""
+	if backend_of(index) == "numpy":
+		import numpy as np
+		return index.ids.copy(), np.array(index.vectors)
+
+	from src.vectorstore.faiss_store import faiss_index_contents
+	return faiss_index_contents(index)
+
+def index_vectors(index, ids: "np.ndarray") -> tuple["np.ndarray", "np.ndarray"]:
+	"""
+	Return (ids, vectors) of those of the given ids that are in the index, without copying the rest of it.
+	"""
+	if backend_of(index) == "numpy":
+		import numpy as np
+		found = np.isin(index.ids, ids)
+		# only the selected rows of a memory-mapped index are read
+		return index.ids[found], np.array(index.vectors[found], dtype=np.float32)
+
+	from src.vectorstore.faiss_store import faiss_index_vectors
+	return faiss_index_vectors(index, ids)
+
+def convert_index(index, backend: str, directory: Path):
+	"""
+	Copy all entries of index into a new index of another backend, stored in directory.
+	"""
+	new_index = load_or_create_index(directory, index.d, backend)
+	ids, vectors = index_contents(index)
+	if ids.size:
+		add_to_index(ids, vectors, new_index, directory)
+	logger.info(f"Converted {backend_of(index)} index with {ids.size} vectors to {backend}")
+	return new_index
+
+def add_to_index(ids: "np.ndarray", embeddings: "np.ndarray", index, directory: Path) -> None:
+	"""
+	Add embeddings with their ids to the index and persist it in directory.
+
+	Args:
+		ids: numpy array of int64 chunk ids, shape (N,)
+		embeddings: numpy array of shape (N, dim)
+		index: the index to add to
+		directory: snapshot dir the index is written to
+	"""
+	# --- add to index ---
+	logger.info(f"Current index size before adding: {index.ntotal}")
+	num_to_add = ids.size
+	
+	index.add_with_ids(embeddings, ids)
+	logger.info(f"Stored {num_to_add} embeddings to the index.")
+	logger.info(f"Index size after adding: {index.ntotal}")
+	
+	persist_index(index, directory)
+
+def remove_from_index(ids: "np.array", index, directory: Path) -> None:
+	"""
+		Delete embeddings from an index by their IDs and persist the updated index.
+
+		Args:
+			ids (np.ndarray): Array of integer IDs to remove from the index.
+			index: The index to update.
+			directory (Path): Snapshot dir the index is written to.
+
+		Returns:
+			None
+	"""
+	if index is None or ids.size == 0:
+		logger.info("No embeddings to delete.")
+		return
+
+	num_to_delete = ids.size
+	index.remove_ids(ids)
+	
+	logger.info(f"Deleted {num_to_delete} embeddings from the index.")
+	logger.info(f"Index size after deletion: {index.ntotal}")
+
+	persist_index(index, directory)
@@ -0,0 +1,143 @@
+import asyncio
+import time
+import unittest
+import numpy as np
+from src.serving.batcher import QueryBatcher
+
+class FakeModel:
+	"""
+	Encodes a string to a vector of (len, 0, 0, 0) and records every batch it is called with.
+	"""
+	def __init__(self):
+		self.batches = []
+
+	def encode(self, texts, convert_to_numpy=True, show_progress_bar=False):
+		self.batches.append(list(texts))
+		vectors = np.zeros((len(texts), 4), dtype="float32")
+		vectors[:, 0] = [len(t) for t in texts]
+		return vectors
+
+class FakeIndex:
+	"""
+	Flat L2 search over a handful of vectors, records the number of search calls.
+	"""
+	def __init__(self, vectors, ids):
+		self.vectors = vectors
+		self.ids = ids
+		self.searches = 0
+
+	def search(self, queries, k):
+		self.searches += 1
+		distances = ((queries[:, None, :] - self.vectors[None, :, :]) ** 2).sum(axis=2)
+		order = np.argsort(distances, axis=1)[:, :k]
+		return np.take_along_axis(distances, order, axis=1), self.ids[order]
+
+class TestQueryBatcher(unittest.IsolatedAsyncioTestCase):
+	def setUp(self):
+		vectors = np.zeros((5, 4), dtype="float32")
+		vectors[:, 0] = [1, 2, 3, 4, 5]
+		self.index = FakeIndex(vectors, np.array([10, 20, 30, 40, 50], dtype=np.int64))
+		self.model = FakeModel()
+
+	async def test_concurrent_queries_share_one_batch(self):
+		async with QueryBatcher(lambda _: (self.index, self.model, "1"), max_batch_size=8, max_wait_ms=50) as batcher:
+			results = await asyncio.gather(*(batcher.query("x" * n, k=1) for n in (1, 3, 5)))
+
+		self.assertEqual(len(self.model.batches), 1)
+		self.assertEqual(self.index.searches, 1)
+		self.assertEqual([int(I[0][0]) for _, I, _ in results], [10, 30, 50])
+
+	async def test_max_batch_size_splits_batches(self):
+		async with QueryBatcher(lambda _: (self.index, self.model, "1"), max_batch_size=2, max_wait_ms=50) as batcher:
+			await asyncio.gather(*(batcher.query("x", k=1) for _ in range(5)))
+
+		self.assertEqual([len(b) for b in self.model.batches], [2, 2, 1])
+
+	async def test_per_request_k(self):
+		async with QueryBatcher(lambda _: (self.index, self.model, "1"), max_wait_ms=50) as batcher:
+			(D1, I1, _), (D3, I3, _) = await asyncio.gather(batcher.query("xx", k=1), batcher.query("xx", k=3))
+
+		self.assertEqual(I1.shape, (1, 1))
+		self.assertEqual(I3.shape, (1, 3))
+		self.assertEqual(int(I3[0][0]), 20)
+
+	async def test_collections_are_searched_separately(self):
+		other = FakeIndex(self.index.vectors, self.index.ids + 1)
+		indexes = {"a": (self.index, self.model, "1"), "b": (other, self.model, "7")}
+
+		async with QueryBatcher(indexes.get, max_wait_ms=50) as batcher:
+			(_, Ia, version_a), (_, Ib, version_b) = await asyncio.gather(batcher.query("x", k=1, collection="a"), batcher.query("x", k=1, collection="b"))
+
+		# one encode for both, one search per collection
+		self.assertEqual(len(self.model.batches), 1)
+		self.assertEqual((self.index.searches, other.searches), (1, 1))
+		self.assertEqual((int(Ia[0][0]), int(Ib[0][0])), (10, 11))
+		# each result says which snapshot it came from
+		self.assertEqual((version_a, version_b), ("1", "7"))
+
+	async def test_collections_with_different_models(self):
+		other_model = FakeModel()
+		indexes = {"a": (self.index, self.model, "1"), "b": (self.index, other_model, "1"), "c": (self.index, self.model, "1")}
+
+		async with QueryBatcher(indexes.get, max_wait_ms=50) as batcher:
+			await asyncio.gather(*(batcher.query("x", collection=c) for c in ("a", "b", "c")))
+
+		# a and c share a model and are encoded together
+		self.assertEqual([len(b) for b in self.model.batches], [2])
+		self.assertEqual([len(b) for b in other_model.batches], [1])
+
+	async def test_errors_are_propagated(self):
+		def broken(*args, **kwargs):
+			raise ValueError("model exploded")
+		self.model.encode = broken
+
+		async with QueryBatcher(lambda _: (self.index, self.model, "1")) as batcher:
+			with self.assertRaises(ValueError):
+				await batcher.query("x")
+
+	async def test_failing_collection_only_fails_its_queries(self):
+		def resolve(collection):
+			if collection == "typo":
+				raise FileNotFoundError("no snapshot for collection 'typo'")
+			return self.index, self.model, "1"
+
+		async with QueryBatcher(resolve, max_wait_ms=50) as batcher:
+			good, bad = await asyncio.gather(batcher.query("x", k=1, collection="good"), batcher.query("x", k=1, collection="typo"), return_exceptions=True)
+
+		self.assertEqual(int(good[1][0][0]), 10)
+		self.assertIsInstance(bad, FileNotFoundError)
+
+	async def test_failing_model_only_fails_its_queries(self):
+		broken_model = FakeModel()
+		def broken(*args, **kwargs):
+			raise ValueError("model exploded")
+		broken_model.encode = broken
+		indexes = {"a": (self.index, self.model, "1"), "b": (self.index, broken_model, "1")}
+
+		async with QueryBatcher(indexes.get, max_wait_ms=50) as batcher:
+			good, bad = await asyncio.gather(batcher.query("x", k=1, collection="a"), batcher.query("x", k=1, collection="b"), return_exceptions=True)
+
+		self.assertEqual(int(good[1][0][0]), 10)
+		self.assertIsInstance(bad, ValueError)
+
+	async def test_stop_cancels_running_batch(self):
+		model = FakeModel()
+		encode = model.encode
+		model.encode = lambda texts, **kwargs: (time.sleep(0.3), encode(texts))[1]
+
+		batcher = QueryBatcher(lambda _: (self.index, model, "1"), max_wait_ms=1)
+		await batcher.start()
+		query = asyncio.ensure_future(batcher.query("xx", k=1))
+		await asyncio.sleep(0.1)
+		await batcher.stop()
+
+		with self.assertRaises(asyncio.CancelledError):
+			await asyncio.wait_for(query, 1)
+
+	async def test_query_before_start(self):
+		batcher = QueryBatcher(lambda _: (self.index, self.model, "1"))
+		with self.assertRaises(RuntimeError):
+			await batcher.query("x")
+
+if __name__ == "__main__":
+	unittest.main()
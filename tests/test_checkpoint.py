@@ -0,0 +1,43 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from src.embedding.checkpoint import EmbeddingCheckpoint
+
+class TestEmbeddingCheckpoint(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.checkpoint_dir = Path(self.temp_dir.name) / "checkpoint"
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_commits_survive_reopening(self):
+		checkpoint = EmbeddingCheckpoint(self.checkpoint_dir, "model-a", 4)
+		checkpoint.commit(np.array([1, 2]), np.ones((2, 4)))
+		checkpoint.commit(np.array([3]), np.zeros((1, 4)))
+
+		reopened = EmbeddingCheckpoint(self.checkpoint_dir, "model-a", 4)
+		ids, embeddings = reopened.load()
+
+		self.assertEqual(reopened.committed_ids(), {1, 2, 3})
+		self.assertEqual(ids.tolist(), [1, 2, 3])
+		self.assertEqual(embeddings.shape, (3, 4))
+		self.assertEqual(embeddings.dtype, np.float32)
+
+	def test_other_model_starts_over(self):
+		EmbeddingCheckpoint(self.checkpoint_dir, "model-a", 4).commit(np.array([1]), np.ones((1, 4)))
+
+		checkpoint = EmbeddingCheckpoint(self.checkpoint_dir, "model-b", 8)
+		ids, embeddings = checkpoint.load()
+
+		self.assertEqual(checkpoint.committed_ids(), set())
+		self.assertEqual(embeddings.shape, (0, 8))
+
+	def test_empty_checkpoint(self):
+		ids, embeddings = EmbeddingCheckpoint(self.checkpoint_dir, "model-a", 4).load()
+		self.assertEqual(ids.size, 0)
+		self.assertEqual(embeddings.shape, (0, 4))
+
+if __name__ == "__main__":
+	unittest.main()
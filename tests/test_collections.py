@@ -0,0 +1,32 @@
+import unittest
+import json
+import tempfile
+from pathlib import Path
+from src.utils.io_utils import data_dir_path
+from src.utils.collection_utils import load_collections, get_collection
+
+class TestCollectionNames(unittest.TestCase):
+	def test_data_dir_rejects_paths(self):
+		for name in ("", "../escaped", "a/b", "a\\b", "..", ".hidden", "a..b"):
+			with self.assertRaises(ValueError, msg=name):
+				data_dir_path(name)
+
+		self.assertEqual(data_dir_path("team_a"), Path("data") / "team_a")
+
+	def test_unknown_collection(self):
+		collections = load_collections(None, Path("kb"), set())
+		self.assertEqual(list(collections), ["default"])
+
+		with self.assertRaises(KeyError):
+			get_collection(collections, "nope")
+
+	def test_collections_file_rejects_paths(self):
+		with tempfile.TemporaryDirectory() as temp_dir:
+			collections_file = Path(temp_dir) / "collections.json"
+			collections_file.write_text(json.dumps({"../escaped": {"knowledge_base_dir": "kb"}}), encoding="utf-8")
+
+			with self.assertRaises(ValueError):
+				load_collections(collections_file, None, set())
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from src.chunking.dedup import (
+	shingles,
+	minhash_signature,
+	estimate_similarity,
+	MinHashLSH,
+	find_near_duplicates,
+	restore_collapsed_entries
+)
+
+BASE = " ".join(f"word{i}" for i in range(200))
+EDITED = BASE.replace("word100", "changed")
+OTHER = " ".join(f"other{i}" for i in range(200))
+
+def entry(chunk_id, chunk, **extra):
+	return {"id": chunk_id, "chunk": chunk, "hash": str(chunk_id), "source": f"{chunk_id}.md", **extra}
+
+class TestMinHash(unittest.TestCase):
+	def test_short_text_is_one_shingle(self):
+		self.assertEqual(shingles("A b"), {"a b"})
+
+	def test_signature_is_deterministic(self):
+		self.assertEqual(minhash_signature(BASE).tolist(), minhash_signature(BASE).tolist())
+
+	def test_similarity_estimates(self):
+		self.assertGreater(estimate_similarity(minhash_signature(BASE), minhash_signature(EDITED)), 0.8)
+		self.assertLess(estimate_similarity(minhash_signature(BASE), minhash_signature(OTHER)), 0.2)
+
+	def test_lsh_finds_near_duplicate(self):
+		lsh = MinHashLSH()
+		lsh.insert(1, minhash_signature(BASE))
+		lsh.insert(2, minhash_signature(OTHER))
+
+		self.assertEqual(lsh.query(minhash_signature(EDITED), 0.8), 1)
+		self.assertIsNone(lsh.query(minhash_signature("something else entirely here"), 0.8))
+
+class TestNearDuplicateStage(unittest.TestCase):
+	def test_reuse(self):
+		sketches = {}
+		to_embed, reuse_from = find_near_duplicates([entry(2, EDITED), entry(3, OTHER)], [entry(1, BASE)], sketches, "reuse", 0.8)
+
+		self.assertEqual([e["id"] for e in to_embed], [3])
+		self.assertEqual(reuse_from, {2: 1})
+		self.assertEqual(set(sketches), {1, 2, 3})
+
+	def test_collapse_within_new_chunks(self):
+		new = [entry(1, BASE), entry(2, EDITED)]
+		to_embed, reuse_from = find_near_duplicates(new, [], {}, "collapse", 0.8)
+
+		self.assertEqual([e["id"] for e in to_embed], [1])
+		self.assertEqual(reuse_from, {})
+		self.assertEqual(new[1]["duplicate_of"], 1)
+
+	def test_collapsed_entries_carry_over(self):
+		old = [entry(1, BASE), entry(2, EDITED, duplicate_of=1)]
+		current = [entry(1, BASE), entry(2, EDITED)]
+
+		self.assertEqual(restore_collapsed_entries(old, current, [], "collapse"), [])
+		self.assertEqual(current[1]["duplicate_of"], 1)
+
+	def test_collapsed_entry_needs_vector_when_canonical_deleted(self):
+		old = [entry(1, BASE), entry(2, EDITED, duplicate_of=1)]
+		current = [entry(2, EDITED)]
+
+		to_add = restore_collapsed_entries(old, current, [old[0]], "collapse")
+		self.assertEqual([e["id"] for e in to_add], [2])
+		self.assertNotIn("duplicate_of", current[0])
+
+if __name__ == "__main__":
+	unittest.main()
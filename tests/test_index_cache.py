@@ -0,0 +1,109 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+from src.vectorstore.index_cache import IndexCache
+
+class FakeIndexCache(IndexCache):
+	"""
+	Every collection "loads" a 1 MB index (ntotal * (d * 4 + 8) bytes) and loads are counted.
+	"""
+	def __init__(self, memory_budget_mb):
+		super().__init__(memory_budget_mb)
+		self.loads = []
+		self.versions = {}
+		self.model_names = {}
+
+	def _latest_version(self, name):
+		return self.versions.get(name, "1")
+
+	def _load(self, name):
+		self.loads.append(name)
+		version = self._latest_version(name)
+		return SimpleNamespace(ntotal=1024, d=254, name=name), version, self.model_names.get(version, "model")
+
+class TestIndexCache(unittest.TestCase):
+	def test_loads_lazily_once(self):
+		cache = FakeIndexCache(memory_budget_mb=10)
+		self.assertEqual(cache.loads, [])
+
+		first = cache.get("a")
+		self.assertIs(cache.get("a"), first)
+		self.assertEqual(cache.loads, ["a"])
+
+	def test_evicts_least_recently_used(self):
+		cache = FakeIndexCache(memory_budget_mb=2)
+		cache.get("a")
+		cache.get("b")
+		# touch a so b becomes least recently used
+		cache.get("a")
+		cache.get("c")
+
+		self.assertIn("a", cache)
+		self.assertIn("c", cache)
+		self.assertNotIn("b", cache)
+		self.assertLessEqual(cache.used_bytes, cache.memory_budget)
+
+	def test_index_bigger_than_budget_is_still_served(self):
+		cache = FakeIndexCache(memory_budget_mb=0.5)
+		cache.get("a")
+		cache.get("b")
+
+		self.assertNotIn("a", cache)
+		self.assertIn("b", cache)
+
+	@mock.patch("src.embedding.embedder.create_embedding_model", lambda model_name: SimpleNamespace(name=model_name))
+	def test_new_snapshot_reloads_in_background(self):
+		cache = FakeIndexCache(memory_budget_mb=10)
+		old = cache.get("a")
+
+		cache.versions["a"] = "2"
+		# the old index keeps being served while the new one loads
+		index, _, version = cache.get_index_and_model("a")
+		self.assertIn(version, ("1", "2"))
+
+		for thread in threading.enumerate():
+			if thread is not threading.current_thread() and thread.daemon:
+				thread.join(timeout=5)
+
+		index, _, version = cache.get_index_and_model("a")
+		self.assertEqual(version, "2")
+		self.assertIsNot(index, old)
+		self.assertEqual(cache.loads, ["a", "a"])
+
+	def test_new_model_loads_outside_the_lock(self):
+		model_loads = []
+		def create_embedding_model(model_name):
+			if model_name == "new-model":
+				time.sleep(0.5)
+			model_loads.append(model_name)
+			return SimpleNamespace(name=model_name)
+
+		with mock.patch("src.embedding.embedder.create_embedding_model", create_embedding_model):
+			cache = FakeIndexCache(memory_budget_mb=10)
+			cache.get_index_and_model("a")
+
+			# a migration published a snapshot that uses another model
+			cache.versions["a"] = "2"
+			cache.model_names["2"] = "new-model"
+
+			started = time.perf_counter()
+			_, model, version = cache.get_index_and_model("a")
+			cache.get("b")
+			# the old snapshot and model keep serving, other collections aren't blocked
+			self.assertLess(time.perf_counter() - started, 0.3)
+			self.assertEqual((model.name, version), ("model", "1"))
+
+			for thread in threading.enumerate():
+				if thread is not threading.current_thread() and thread.daemon:
+					thread.join(timeout=5)
+
+			started = time.perf_counter()
+			_, model, version = cache.get_index_and_model("a")
+			self.assertLess(time.perf_counter() - started, 0.3)
+			self.assertEqual((model.name, version), ("new-model", "2"))
+			self.assertEqual(model_loads, ["model", "new-model"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import logging
+import tempfile
+from pathlib import Path
+from unittest import mock
+import numpy as np
+import build
+from migrate import embed_missing_chunks, write_migrated_snapshot
+from src.embedding.checkpoint import EmbeddingCheckpoint
+from src.utils.io_utils import save_dict_to_json, save_jsonl, read_file, load_jsonl_metadata
+from src.utils.snapshot_utils import create_staging_dir, publish_snapshot, read_manifest, write_manifest
+from src.vectorstore.store import load_index, index_contents
+
+logger = logging.getLogger(__name__)
+
+class FakeModel:
+	"""
+	Encodes a string to (len, 1, 1, ...) with `dim` dimensions and records what it embedded.
+	"""
+	def __init__(self, dim=4):
+		self.dim = dim
+		self.encoded = []
+
+	def get_sentence_embedding_dimension(self):
+		return self.dim
+
+	def encode(self, texts, **kwargs):
+		self.encoded.extend(texts)
+		vectors = np.ones((len(texts), self.dim), dtype=np.float32)
+		vectors[:, 0] = [len(text) for text in texts]
+		return vectors
+
+def entry(chunk_id, chunk, **extra):
+	return {"id": chunk_id, "chunk": chunk, "hash": f"h{chunk_id}", "source": "a.md", **extra}
+
+class TestMigration(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.root = Path(self.temp_dir.name)
+		self.snapshot_dir = self.root / "snapshot"
+		self.snapshot_dir.mkdir()
+		self.staging_dir = self.root / "staging"
+		self.staging_dir.mkdir()
+		self.checkpoint = EmbeddingCheckpoint(self.root / "migration", "new-model", 4)
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def write_snapshot(self, entries):
+		write_manifest(self.snapshot_dir, "old-model", 8, "numpy")
+		save_dict_to_json(self.snapshot_dir / "metadata.json", {"a.md": "h"})
+		save_jsonl(entries, self.snapshot_dir / "metadata_store.jsonl")
+
+	def test_resumes_and_skips_done_ids(self):
+		self.write_snapshot([entry(1, "a"), entry(2, "bb"), entry(3, "ccc"), entry(2, "bb"), entry(4, "dddd", duplicate_of=1)])
+		self.checkpoint.commit(np.array([1], dtype=np.int64), np.ones((1, 4), dtype=np.float32))
+
+		model = FakeModel()
+		embed_missing_chunks(logger, self.snapshot_dir, model, self.checkpoint, 1, None)
+
+		# 1 was committed before, 2 appears twice, 4 is a collapsed near-duplicate without a vector
+		self.assertEqual(model.encoded, ["bb", "ccc"])
+		self.assertEqual(self.checkpoint.committed_ids(), {1, 2, 3})
+
+		model = FakeModel()
+		embed_missing_chunks(logger, self.snapshot_dir, model, self.checkpoint, 1, None)
+		self.assertEqual(model.encoded, [])
+
+	def test_refuses_cutover_with_missing_chunks(self):
+		self.write_snapshot([entry(1, "a"), entry(2, "bb")])
+		self.checkpoint.commit(np.array([1], dtype=np.int64), np.ones((1, 4), dtype=np.float32))
+
+		with self.assertRaises(RuntimeError):
+			write_migrated_snapshot(logger, self.snapshot_dir, self.staging_dir, self.checkpoint, "new-model", 4)
+
+	def test_drops_chunks_deleted_during_migration(self):
+		self.checkpoint.commit(np.array([1, 2, 3], dtype=np.int64), FakeModel().encode(["a", "bb", "ccc"]))
+		# a build deleted chunk 2 after it was migrated
+		self.write_snapshot([entry(1, "a"), entry(3, "ccc")])
+
+		write_migrated_snapshot(logger, self.snapshot_dir, self.staging_dir, self.checkpoint, "new-model", 4)
+
+		ids, vectors = index_contents(load_index(self.staging_dir, "numpy"))
+		self.assertEqual(sorted(ids.tolist()), [1, 3])
+		self.assertEqual(read_manifest(self.staging_dir), {"model": "new-model", "dim": 4, "backend": "numpy"})
+		self.assertEqual(len(load_jsonl_metadata(read_file(self.staging_dir / "metadata_store.jsonl"))), 2)
+
+class TestBuildManifest(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.root = Path(self.temp_dir.name)
+		self.knowledge_base = self.root / "kb"
+		self.knowledge_base.mkdir()
+		self.data_dir = self.root / "data"
+		self.data_dir.mkdir()
+		self.collection = {
+			"name": "default",
+			"knowledge_base_dir": self.knowledge_base,
+			"ignore": [],
+			"extensions": (".md",),
+			"model": "fake-model",
+			"backend": "numpy",
+		}
+		self.model = FakeModel(dim=4)
+		patcher = mock.patch.object(build, "create_embedding_model", lambda name: self.model)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def build(self, base_dir):
+		staging_dir = create_staging_dir(self.data_dir)
+		build.build_snapshot(logger, self.collection, base_dir, staging_dir, self.data_dir / "embed_cache")
+		return staging_dir
+
+	def test_first_build_takes_dim_from_model(self):
+		(self.knowledge_base / "a.md").write_text("# title\n\nsome text about tcp", encoding="utf-8")
+
+		staging_dir = self.build(None)
+
+		self.assertEqual(read_manifest(staging_dir), {"model": "fake-model", "dim": 4, "backend": "numpy"})
+		self.assertEqual(load_index(staging_dir, "numpy").d, 4)
+
+	def test_dimension_mismatch_raises(self):
+		(self.knowledge_base / "a.md").write_text("# title\n\nsome text about tcp", encoding="utf-8")
+		base_dir = publish_snapshot(self.data_dir, self.build(None))
+
+		# the model now produces vectors of another size than the index was built with
+		self.model = FakeModel(dim=8)
+		(self.knowledge_base / "b.md").write_text("# other\n\nsome text about udp", encoding="utf-8")
+
+		with self.assertRaises(ValueError):
+			self.build(base_dir)
+
+if __name__ == "__main__":
+	unittest.main()
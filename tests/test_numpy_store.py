@@ -0,0 +1,105 @@
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+from src.vectorstore import numpy_store
+from src.vectorstore.numpy_store import NumpyIndex, load_or_create_numpy_index
+from src.vectorstore.store import add_to_index, remove_from_index, load_or_create_index, load_index, convert_index, index_vectors
+
+class TestNumpyIndex(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.directory = Path(self.temp_dir.name)
+
+		rng = np.random.default_rng(42)
+		self.vectors = rng.random((50, 8), dtype=np.float32)
+		self.ids = np.arange(1000, 1050, dtype=np.int64)
+		self.queries = rng.random((3, 8), dtype=np.float32)
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def brute_force(self, k):
+		distances = ((self.queries[:, None, :] - self.vectors[None, :, :]) ** 2).sum(axis=2)
+		order = np.argsort(distances, axis=1)[:, :k]
+		return np.take_along_axis(distances, order, axis=1), self.ids[order]
+
+	def test_search_matches_brute_force(self):
+		index = NumpyIndex(self.vectors, self.ids)
+		D, I = index.search(self.queries, 5)
+		expected_D, expected_I = self.brute_force(5)
+
+		np.testing.assert_array_equal(I, expected_I)
+		np.testing.assert_allclose(D, expected_D, rtol=1e-4, atol=1e-5)
+
+	def test_search_across_blocks(self):
+		block_rows = numpy_store.SEARCH_BLOCK_ROWS
+		numpy_store.SEARCH_BLOCK_ROWS = 7
+		try:
+			_, I = NumpyIndex(self.vectors, self.ids).search(self.queries, 5)
+		finally:
+			numpy_store.SEARCH_BLOCK_ROWS = block_rows
+
+		np.testing.assert_array_equal(I, self.brute_force(5)[1])
+
+	def test_fewer_vectors_than_k(self):
+		D, I = NumpyIndex(self.vectors[:2], self.ids[:2]).search(self.queries[:1], 4)
+
+		self.assertEqual(I[0, 2:].tolist(), [-1, -1])
+		self.assertEqual(sorted(I[0, :2].tolist()), [1000, 1001])
+		self.assertTrue(np.all(D[0, 2:] == np.finfo(np.float32).max))
+
+	def test_persist_add_remove_and_reload(self):
+		index = load_or_create_numpy_index(self.directory, 8)
+		add_to_index(self.ids, self.vectors, index, self.directory)
+		remove_from_index(self.ids[:10], index, self.directory)
+
+		reloaded = load_or_create_index(self.directory, 8, "numpy")
+		self.assertIsInstance(reloaded.vectors, np.memmap)
+		self.assertEqual(reloaded.ntotal, 40)
+		np.testing.assert_array_equal(reloaded.reconstruct(1020), self.vectors[20])
+		np.testing.assert_array_equal(reloaded.search(self.queries, 3)[1], NumpyIndex(self.vectors[10:], self.ids[10:]).search(self.queries, 3)[1])
+
+	def test_convert_to_faiss_and_back(self):
+		try:
+			import faiss  # noqa: F401
+		except ImportError:
+			self.skipTest("faiss not installed")
+
+		index = NumpyIndex(self.vectors, self.ids)
+		faiss_index = convert_index(index, "faiss", self.directory)
+		back = convert_index(faiss_index, "numpy", self.directory)
+
+		self.assertTrue((self.directory / "index.faiss").exists())
+		np.testing.assert_array_equal(faiss_index.search(self.queries, 5)[1], self.brute_force(5)[1])
+		np.testing.assert_array_equal(back.search(self.queries, 5)[1], self.brute_force(5)[1])
+
+	def test_load_index_never_creates(self):
+		with self.assertRaises(FileNotFoundError):
+			load_index(self.directory, "numpy")
+		self.assertEqual(list(self.directory.iterdir()), [])
+
+		add_to_index(self.ids, self.vectors, load_or_create_index(self.directory, 8, "numpy"), self.directory)
+		self.assertEqual(load_index(self.directory, "numpy").ntotal, 50)
+
+	def test_index_vectors_of_some_ids(self):
+		wanted = np.array([1049, 1003, 7, 1010], dtype=np.int64)
+		backends = ["numpy"]
+		try:
+			import faiss  # noqa: F401
+			backends.append("faiss")
+		except ImportError:
+			pass
+
+		for backend in backends:
+			directory = self.directory / backend
+			directory.mkdir()
+			add_to_index(self.ids, self.vectors, load_or_create_index(directory, 8, backend), directory)
+
+			ids, vectors = index_vectors(load_index(directory, backend), wanted)
+			order = np.argsort(ids)
+			np.testing.assert_array_equal(ids[order], [1003, 1010, 1049])
+			np.testing.assert_array_equal(vectors[order], self.vectors[[3, 10, 49]])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import logging
+import tempfile
+from pathlib import Path
+import numpy as np
+from partition import merge_partials
+from src.utils.hash_utils import partition_of
+from src.utils.io_utils import save_dict_to_json, save_jsonl, read_file, json_to_dict, load_jsonl_metadata
+from src.utils.snapshot_utils import write_manifest, read_manifest
+from src.vectorstore.store import load_or_create_index, add_to_index, index_contents
+
+logger = logging.getLogger(__name__)
+
+class TestMergePartials(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.root = Path(self.temp_dir.name)
+		self.staging_dir = self.root / "staging"
+		self.staging_dir.mkdir()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def write_partial(self, name, files, entries, dim=4, run="run-1", base="0001"):
+		partial_dir = self.root / name
+		partial_dir.mkdir()
+
+		index = load_or_create_index(partial_dir, dim, "numpy")
+		ids = np.array(sorted({entry["id"] for entry in entries}), dtype=np.int64)
+		if ids.size:
+			add_to_index(ids, np.tile(ids[:, None], (1, dim)).astype(np.float32), index, partial_dir)
+
+		write_manifest(partial_dir, "test-model", dim, "numpy", run=run, base=base)
+		save_dict_to_json(partial_dir / "metadata.json", files)
+		save_dict_to_json(partial_dir / "file_stats.json", {path: [1, 1] for path in files})
+		save_jsonl(entries, partial_dir / "metadata_store.jsonl")
+		return partial_dir
+
+	def entry(self, chunk_id, chunk_hash, source):
+		return {"id": chunk_id, "chunk": f"chunk {chunk_hash}", "hash": chunk_hash, "source": source}
+
+	def test_merges_metadata_and_vectors(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md"), self.entry(2, "x2", "a.md")])
+		second = self.write_partial("1", {"b.md": "h2"}, [self.entry(3, "x3", "b.md")])
+
+		merge_partials(logger, [first, second], self.staging_dir, "run-1", "0001")
+
+		self.assertEqual(json_to_dict(read_file(self.staging_dir / "metadata.json")), {"a.md": "h1", "b.md": "h2"})
+		self.assertEqual([entry["id"] for entry in load_jsonl_metadata(read_file(self.staging_dir / "metadata_store.jsonl"))], [1, 2, 3])
+		self.assertEqual(read_manifest(self.staging_dir), {"model": "test-model", "dim": 4, "backend": "numpy"})
+
+		ids, vectors = index_contents(load_or_create_index(self.staging_dir, 4, "numpy"))
+		np.testing.assert_array_equal(np.sort(ids), [1, 2, 3])
+		np.testing.assert_array_equal(vectors[:, 0], ids)
+
+	def test_same_chunk_in_two_partitions_keeps_one_vector(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+		second = self.write_partial("1", {"b.md": "h2"}, [self.entry(1, "x1", "b.md"), self.entry(2, "x2", "b.md")])
+
+		merge_partials(logger, [first, second], self.staging_dir, base_version="0001")
+
+		ids, _ = index_contents(load_or_create_index(self.staging_dir, 4, "numpy"))
+		np.testing.assert_array_equal(np.sort(ids), [1, 2])
+		self.assertEqual(len(load_jsonl_metadata(read_file(self.staging_dir / "metadata_store.jsonl"))), 3)
+
+	def test_id_collision_fails(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+		second = self.write_partial("1", {"b.md": "h2"}, [self.entry(1, "other", "b.md")])
+
+		with self.assertRaisesRegex(RuntimeError, "collision"):
+			merge_partials(logger, [first, second], self.staging_dir, base_version="0001")
+
+	def test_file_in_two_partials_fails(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+		second = self.write_partial("1", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+
+		with self.assertRaisesRegex(RuntimeError, "more than one partial"):
+			merge_partials(logger, [first, second], self.staging_dir, base_version="0001")
+
+	def test_different_dimensions_fail(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")], dim=4)
+		second = self.write_partial("1", {"b.md": "h2"}, [self.entry(2, "x2", "b.md")], dim=8)
+
+		with self.assertRaisesRegex(RuntimeError, "different models"):
+			merge_partials(logger, [first, second], self.staging_dir, base_version="0001")
+
+	def test_missing_vectors_fail(self):
+		partial = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+		save_jsonl([self.entry(1, "x1", "a.md"), self.entry(2, "x2", "a.md")], partial / "metadata_store.jsonl")
+
+		with self.assertRaisesRegex(RuntimeError, "missing vectors"):
+			merge_partials(logger, [partial], self.staging_dir, base_version="0001")
+
+	def test_partials_of_different_runs_fail(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")], run="run-1")
+		second = self.write_partial("1", {"b.md": "h2"}, [self.entry(2, "x2", "b.md")], run="run-0")
+
+		with self.assertRaisesRegex(RuntimeError, "different runs"):
+			merge_partials(logger, [first, second], self.staging_dir, base_version="0001")
+
+	def test_partials_of_another_run_than_requested_fail(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+
+		with self.assertRaisesRegex(RuntimeError, "expected run-2"):
+			merge_partials(logger, [first], self.staging_dir, "run-2", "0001")
+
+	def test_partials_of_another_base_snapshot_fail(self):
+		first = self.write_partial("0", {"a.md": "h1"}, [self.entry(1, "x1", "a.md")])
+		second = self.write_partial("1", {"b.md": "h2"}, [self.entry(2, "x2", "b.md")], base=None)
+
+		with self.assertRaisesRegex(RuntimeError, "another snapshot"):
+			merge_partials(logger, [first, second], self.staging_dir, base_version="0001")
+
+class TestPartitionOf(unittest.TestCase):
+	def test_stable_and_in_range(self):
+		paths = [f"docs/file_{i}.md" for i in range(200)]
+		partitions = [partition_of(path, 4) for path in paths]
+
+		self.assertEqual(partitions, [partition_of(path, 4) for path in paths])
+		self.assertEqual(set(partitions), {0, 1, 2, 3})
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+import os
+import signal
+import time
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+import numpy as np
+from src.embedding.checkpoint import EmbeddingCheckpoint
+from src.embedding.embedder import embed_in_batches
+from src.utils.signal_utils import ShutdownRequested, graceful_shutdown, stop_when_parent_stops
+from partition import run_job, wait_for_jobs
+
+class FakeModel:
+	def __init__(self, dim=4, on_encode=None):
+		self.dim = dim
+		self.on_encode = on_encode
+		self.encoded = []
+
+	def encode(self, texts, **kwargs):
+		self.encoded.extend(texts)
+		if self.on_encode:
+			self.on_encode()
+		return np.array([[len(text), len(self.encoded), 0, 1] for text in texts], dtype=np.float32)
+
+def slow_job(batches):
+	with graceful_shutdown() as shutdown:
+		for _ in range(batches):
+			shutdown.check()
+			time.sleep(0.05)
+
+def entries(count):
+	return [{"id": 100 + i, "chunk": "x" * (i + 1)} for i in range(count)]
+
+class TestEmbedInBatches(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.checkpoint = EmbeddingCheckpoint(Path(self.temp_dir.name) / "cache", "fake", 4)
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_embeddings_follow_entry_order(self):
+		chunks = entries(5)
+		embeddings = embed_in_batches(list(reversed(chunks)), FakeModel(), self.checkpoint, batch_size=2)
+
+		self.assertEqual(embeddings.shape, (5, 4))
+		np.testing.assert_array_equal(embeddings[:, 0], [5, 4, 3, 2, 1])
+		self.assertEqual(len(self.checkpoint.committed_ids()), 5)
+
+	def test_identical_chunks_are_embedded_once(self):
+		chunks = entries(3) + entries(1)
+		model = FakeModel()
+		embeddings = embed_in_batches(chunks, model, self.checkpoint, batch_size=2)
+
+		self.assertEqual(len(model.encoded), 3)
+		np.testing.assert_array_equal(embeddings[3], embeddings[0])
+
+	def test_resumes_from_committed_batches(self):
+		chunks = entries(6)
+		embed_in_batches(chunks[:4], FakeModel(), self.checkpoint, batch_size=2)
+
+		model = FakeModel()
+		embeddings = embed_in_batches(chunks, model, self.checkpoint, batch_size=2)
+
+		self.assertEqual(model.encoded, [chunk["chunk"] for chunk in chunks[4:]])
+		np.testing.assert_array_equal(embeddings[:, 0], [1, 2, 3, 4, 5, 6])
+
+	def test_signal_stops_after_current_batch(self):
+		chunks = entries(6)
+		model = FakeModel(on_encode=lambda: os.kill(os.getpid(), signal.SIGTERM))
+
+		with graceful_shutdown() as shutdown:
+			with self.assertRaises(ShutdownRequested) as raised:
+				embed_in_batches(chunks, model, self.checkpoint, batch_size=2, shutdown=shutdown)
+
+		self.assertEqual(raised.exception.signum, signal.SIGTERM)
+		self.assertEqual(len(model.encoded), 2)
+		self.assertEqual(self.checkpoint.committed_ids(), {100, 101})
+
+class TestGracefulShutdown(unittest.TestCase):
+	def test_restores_previous_handler(self):
+		previous = signal.getsignal(signal.SIGTERM)
+		with graceful_shutdown():
+			self.assertNotEqual(signal.getsignal(signal.SIGTERM), previous)
+		self.assertEqual(signal.getsignal(signal.SIGTERM), previous)
+
+	def test_second_signal_interrupts(self):
+		with graceful_shutdown() as shutdown:
+			os.kill(os.getpid(), signal.SIGINT)
+			self.assertTrue(shutdown.requested)
+			with self.assertRaises(KeyboardInterrupt):
+				os.kill(os.getpid(), signal.SIGINT)
+
+	def test_on_signal_sees_every_signal(self):
+		received = []
+		with graceful_shutdown(on_signal=received.append):
+			os.kill(os.getpid(), signal.SIGTERM)
+			with self.assertRaises(KeyboardInterrupt):
+				os.kill(os.getpid(), signal.SIGTERM)
+		self.assertEqual(received, [signal.SIGTERM, signal.SIGTERM])
+
+class TestWaitForJobs(unittest.TestCase):
+	def start_jobs(self, stop_signal, count=2, batches=1000):
+		jobs = [multiprocessing.Process(target=run_job, args=(stop_signal, os.getpid(), slow_job, batches)) for _ in range(count)]
+		for job in jobs:
+			job.start()
+		return jobs
+
+	def test_signal_to_parent_stops_the_jobs(self):
+		stop_signal = multiprocessing.Value("i", 0)
+		jobs = self.start_jobs(stop_signal)
+		# only this process gets the signal, like `kill <pid>` would
+		threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM)).start()
+		started = time.monotonic()
+
+		with self.assertRaises(ShutdownRequested) as raised:
+			wait_for_jobs(jobs, stop_signal)
+
+		self.assertEqual(raised.exception.signum, signal.SIGTERM)
+		self.assertLess(time.monotonic() - started, 10)
+		self.assertEqual([job.exitcode for job in jobs], [128 + signal.SIGTERM] * 2)
+
+	def test_failed_job_raises(self):
+		stop_signal = multiprocessing.Value("i", 0)
+		jobs = self.start_jobs(stop_signal, batches=1) + [multiprocessing.Process(target=run_job, args=(stop_signal, os.getpid(), slow_job, "not a number"))]
+		jobs[-1].start()
+
+		with self.assertRaisesRegex(RuntimeError, "failed"):
+			wait_for_jobs(jobs, stop_signal)
+		self.assertEqual([job.exitcode for job in jobs[:2]], [0, 0])
+
+	def test_job_stops_when_parent_is_gone(self):
+		stop_signal = multiprocessing.Value("i", 0)
+		# the job is told its parent is another process, as if the parent died and the job was reparented
+		job = multiprocessing.Process(target=run_job, args=(stop_signal, os.getpid() + 1, slow_job, 1000))
+		job.start()
+		job.join(10)
+
+		self.assertEqual(job.exitcode, 128 + signal.SIGHUP)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os
+import importlib
+import tempfile
+from pathlib import Path
+from unittest import mock
+from src.utils.scan_utils import IgnoreMatcher, scan_knowledge_files, retrieve_md_filenames
+from src.utils.collection_utils import configured_collection
+import config
+
+class TestIgnoreMatcher(unittest.TestCase):
+	def test_name_matches_at_any_depth(self):
+		matcher = IgnoreMatcher([".git", "*.tmp.md"])
+		self.assertTrue(matcher.ignored(".git", is_dir=True))
+		self.assertTrue(matcher.ignored("docs/.git", is_dir=True))
+		self.assertTrue(matcher.ignored("docs/notes.tmp.md", is_dir=False))
+		self.assertFalse(matcher.ignored("docs/notes.md", is_dir=False))
+
+	def test_dir_only_and_anchored(self):
+		matcher = IgnoreMatcher(["drafts/", "/archive", "docs/old"])
+		self.assertTrue(matcher.ignored("a/drafts", is_dir=True))
+		self.assertFalse(matcher.ignored("a/drafts", is_dir=False))
+		self.assertTrue(matcher.ignored("archive", is_dir=True))
+		self.assertFalse(matcher.ignored("a/archive", is_dir=True))
+		self.assertTrue(matcher.ignored("docs/old", is_dir=True))
+		self.assertFalse(matcher.ignored("x/docs/old", is_dir=True))
+
+	def test_double_star_and_negation(self):
+		matcher = IgnoreMatcher(["# comment", "", "**/private/*.md", "*.md", "!keep.md"])
+		self.assertTrue(matcher.ignored("a/b/private/x.md", is_dir=False))
+		self.assertTrue(matcher.ignored("x.md", is_dir=False))
+		self.assertFalse(matcher.ignored("sub/keep.md", is_dir=False))
+
+	def test_character_class(self):
+		matcher = IgnoreMatcher(["draft[0-9].md", "v[!1].md"])
+		self.assertTrue(matcher.ignored("draft3.md", is_dir=False))
+		self.assertFalse(matcher.ignored("drafts.md", is_dir=False))
+		self.assertTrue(matcher.ignored("v2.md", is_dir=False))
+		self.assertFalse(matcher.ignored("v1.md", is_dir=False))
+
+class TestScanKnowledgeFiles(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.base = Path(self.temp_dir.name)
+
+		(self.base / "file1.md").write_text("# file1")
+		(self.base / "file2.txt").write_text("not markdown")
+		(self.base / "notes.markdown").write_text("other extension")
+		(self.base / ".git").mkdir()
+		(self.base / ".git" / "ignored.md").write_text("should be ignored")
+		for depth in range(3):
+			nested = self.base.joinpath(*[f"d{i}" for i in range(depth + 1)])
+			nested.mkdir()
+			(nested / f"nested{depth}.md").write_text("nested file")
+		(self.base / "d0" / "drafts").mkdir()
+		(self.base / "d0" / "drafts" / "draft.md").write_text("draft")
+		(self.base / ".gitignore").write_text("drafts/\n")
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def test_scan_with_ignores_and_extensions(self):
+		scanned = list(scan_knowledge_files(self.base, [".git"], (".md", ".markdown"), workers=4, ignore_file=self.base / ".gitignore"))
+		relative_paths = sorted(f.relative_path for f in scanned)
+
+		self.assertEqual(relative_paths, ["d0/d1/d2/nested2.md", "d0/d1/nested1.md", "d0/nested0.md", "file1.md", "notes.markdown"])
+
+	def test_stat_info(self):
+		scanned = {f.relative_path: f for f in scan_knowledge_files(self.base, [".git"])}
+		stat = (self.base / "file1.md").stat()
+
+		self.assertEqual(scanned["file1.md"].size, stat.st_size)
+		self.assertEqual(scanned["file1.md"].mtime_ns, stat.st_mtime_ns)
+		self.assertEqual(scanned["file1.md"].path, str(self.base / "file1.md"))
+
+	def test_retrieve_md_filenames(self):
+		md_files = retrieve_md_filenames(self.base, {".git"})
+		self.assertEqual({f.name for f in md_files}, {"file1.md", "nested0.md", "nested1.md", "nested2.md", "draft.md"})
+
+	def test_ignore_patterns_from_env_keep_their_order(self):
+		(self.base / "keep.md").write_text("kept")
+		env = {"KNOWLEDGE_BASE_DIR": str(self.base), "IGNORE_DIRS": ".git, *.md,,!keep.md", "COLLECTIONS_FILE": str(self.base / "missing.json")}
+		with mock.patch.dict(os.environ, env):
+			importlib.reload(config)
+		self.addCleanup(importlib.reload, config)
+
+		collection = configured_collection("default")
+		self.assertEqual(collection["ignore"], [".git", "*.md", "!keep.md"])
+
+		scanned = scan_knowledge_files(collection["knowledge_base_dir"], collection["ignore"], collection["extensions"])
+		self.assertEqual(sorted(f.relative_path for f in scanned), ["keep.md"])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+import build
+from src.utils.snapshot_utils import (
+	build_lock,
+	current_snapshot_dir,
+	current_snapshot_version,
+	create_staging_dir,
+	gc_snapshots,
+	import_legacy_data,
+	publish_snapshot,
+	LEGACY_FILES
+)
+
+class TestSnapshots(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.data_dir = Path(self.temp_dir.name)
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def publish(self, content):
+		staging_dir = create_staging_dir(self.data_dir)
+		(staging_dir / "metadata.json").write_text(content, encoding="utf-8")
+		return publish_snapshot(self.data_dir, staging_dir)
+
+	def test_nothing_published(self):
+		self.assertIsNone(current_snapshot_dir(self.data_dir))
+
+	def test_staging_dir_is_not_current(self):
+		first = self.publish("first")
+		create_staging_dir(self.data_dir)
+
+		self.assertEqual(current_snapshot_dir(self.data_dir), first)
+
+	def test_publish_swaps_pointer(self):
+		first = self.publish("first")
+		second = self.publish("second")
+
+		self.assertEqual(current_snapshot_dir(self.data_dir), second)
+		self.assertEqual((self.data_dir / "CURRENT").read_text(encoding="utf-8"), second.name)
+		# the previous snapshot is untouched, readers that loaded it keep working
+		self.assertEqual((first / "metadata.json").read_text(encoding="utf-8"), "first")
+		self.assertFalse((self.data_dir / "CURRENT.tmp").exists())
+
+	def test_gc_keeps_newest_and_current(self):
+		snapshots = [self.publish(str(i)) for i in range(4)]
+		leftover = create_staging_dir(self.data_dir)
+
+		removed = gc_snapshots(self.data_dir, keep=2)
+
+		self.assertFalse(leftover.exists())
+		self.assertEqual([snapshot.exists() for snapshot in snapshots], [False, False, True, True])
+		self.assertEqual(set(removed), {snapshots[0].name, snapshots[1].name, leftover.name})
+
+	def test_gc_never_removes_current(self):
+		snapshots = [self.publish(str(i)) for i in range(3)]
+		# e.g. rolled back by hand
+		(self.data_dir / "CURRENT").write_text(snapshots[0].name, encoding="utf-8")
+
+		gc_snapshots(self.data_dir, keep=1)
+
+		self.assertEqual([snapshot.exists() for snapshot in snapshots], [True, False, True])
+		self.assertEqual(current_snapshot_dir(self.data_dir), snapshots[0])
+
+	def test_lock_refuses_second_holder(self):
+		with build_lock(self.data_dir):
+			with self.assertRaises(RuntimeError):
+				with build_lock(self.data_dir):
+					pass
+
+		# released again
+		with build_lock(self.data_dir):
+			pass
+
+	def test_lock_waits_for_holder(self):
+		released = threading.Event()
+
+		def hold():
+			with build_lock(self.data_dir):
+				holding.set()
+				time.sleep(0.7)
+				released.set()
+
+		holding = threading.Event()
+		holder = threading.Thread(target=hold)
+		holder.start()
+		holding.wait()
+
+		with self.assertRaises(RuntimeError):
+			with build_lock(self.data_dir, timeout=0.1):
+				pass
+
+		with build_lock(self.data_dir, timeout=None):
+			self.assertTrue(released.is_set())
+		holder.join()
+
+	def test_failed_build_keeps_previous_snapshot(self):
+		first = self.publish("first")
+
+		def failing_build(logger, collection, base_dir, staging_dir, cache_dir):
+			self.assertEqual(base_dir, first)
+			(staging_dir / "metadata.json").write_text("half written", encoding="utf-8")
+			raise RuntimeError("embedding failed")
+
+		with mock.patch.object(build, "configured_collection", return_value={"name": "default"}), \
+			mock.patch.object(build, "ensure_data_dir", return_value=self.data_dir), \
+			mock.patch.object(build, "build_snapshot", failing_build):
+			with self.assertRaises(RuntimeError):
+				build.main(mock.Mock(), "default")
+
+		self.assertEqual(current_snapshot_dir(self.data_dir), first)
+		self.assertEqual((first / "metadata.json").read_text(encoding="utf-8"), "first")
+		# the staging dir was discarded
+		self.assertEqual([path.name for path in (self.data_dir / "snapshots").iterdir()], [first.name])
+
+class TestImportLegacyData(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.root = Path(self.temp_dir.name)
+		self.data_dir = self.root / "default"
+		self.data_dir.mkdir()
+
+	def tearDown(self):
+		self.temp_dir.cleanup()
+
+	def write_legacy_files(self, directory):
+		for name in LEGACY_FILES:
+			(directory / name).write_text(name, encoding="utf-8")
+
+	def test_legacy_files_become_first_snapshot(self):
+		self.write_legacy_files(self.root)
+
+		published = import_legacy_data(self.data_dir, [self.data_dir, self.root])
+
+		self.assertEqual(current_snapshot_dir(self.data_dir), published)
+		for name in LEGACY_FILES:
+			self.assertEqual((published / name).read_text(encoding="utf-8"), name)
+			self.assertFalse((self.root / name).exists())
+
+	def test_nothing_to_import(self):
+		self.assertIsNone(import_legacy_data(self.data_dir, [self.data_dir, self.root]))
+		self.assertIsNone(current_snapshot_version(self.data_dir))
+
+	def test_existing_snapshot_wins(self):
+		publish_snapshot(self.data_dir, create_staging_dir(self.data_dir))
+		self.write_legacy_files(self.data_dir)
+
+		self.assertIsNone(import_legacy_data(self.data_dir, [self.data_dir]))
+		self.assertTrue((self.data_dir / "index.faiss").exists())
+
+if __name__ == "__main__":
+	unittest.main()